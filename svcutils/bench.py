@@ -0,0 +1,279 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from unittest.mock import patch
+
+from svcutils import notifier, service
+from svcutils.tracker import Attempt
+
+SIZES = [1000, 10000, 100000]
+MIN_TIME = .2
+REPEAT = 5
+THRESHOLD = .25
+VOLUME_LABELS = ['backup', 'data', 'media']
+FAKE_NOTIFY_SEND = '#!/bin/sh\necho 42\n'
+
+
+def generate_attempts(count, attempt_delta=120, run_every=10, end_ts=None):
+    # synthetic history ending now, a run every run_every attempts, a volume plugged every 50 attempts
+    end_ts = end_ts or time.time()
+    res = []
+    for i in range(count):
+        ts = end_ts - (count - i) * attempt_delta
+        is_run = i % run_every == 0
+        res.append(Attempt(ts=ts, is_online=i % 7 != 0, volume_labels=VOLUME_LABELS[:2 + (i // 50) % 2],
+                           code='ready' if is_run else 'not_ready', end_ts=ts + 30 if is_run else None))
+    return res
+
+
+class FakeProcess:
+    def __init__(self, environ):
+        self.info = {'pid': 0, 'environ': environ}
+
+
+class FakeEWMH:
+    def getActiveWindow(self):
+        return 1
+
+    def getWmState(self, win, str):
+        return ['_NET_WM_STATE_FOCUSED']
+
+    def getWmName(self, win):
+        return b'window'
+
+
+@contextlib.contextmanager
+def stub_probes(processes=200):
+    # no display, network, volume or cpu probing, the display env is found in the last process
+    procs = [FakeProcess({'PATH': '/usr/bin'}) for i in range(processes - 1)]
+    procs.append(FakeProcess({'DISPLAY': ':0', 'XAUTHORITY': '/tmp/xauth', 'DBUS_SESSION_BUS_ADDRESS': 'bus'}))
+    with patch.object(service.psutil, 'process_iter', side_effect=lambda *args, **kwargs: iter(procs)), \
+            patch.object(service.psutil, 'cpu_percent', return_value=1.), \
+            patch.object(service, 'is_online', return_value=True), \
+            patch.object(service, 'get_volume_labels', return_value=VOLUME_LABELS[:2]), \
+            patch.dict(sys.modules, {'ewmh': types.SimpleNamespace(EWMH=FakeEWMH)}), \
+            patch.dict(os.environ, {'DISPLAY': ':0'}):
+        yield
+
+
+@contextlib.contextmanager
+def fake_notify_send(work_dir):
+    bin_dir = os.path.join(work_dir, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    file = os.path.join(bin_dir, 'notify-send')
+    with open(file, 'w') as fd:
+        fd.write(FAKE_NOTIFY_SEND)
+    os.chmod(file, os.stat(file).st_mode | stat.S_IEXEC)
+    with patch.dict(os.environ, {'PATH': f'{bin_dir}{os.pathsep}{os.environ.get("PATH", "")}'}), \
+            patch.object(notifier.LinuxNotifier, 'meta_file', os.path.join(work_dir, 'notifier.json')):
+        yield
+
+
+def _get_service(work_dir, size, **kwargs):
+    se = service.Service(target=lambda: None, work_dir=work_dir, run_delta=size * 120, min_uptime=size * 60,
+                         requires_online=True, trigger_on_volume_change=True, **kwargs)
+    attempts = generate_attempts(size)
+    se.tracker_data['attempts'] = attempts
+    se.tracker_data['last_run'] = attempts[0]
+    return se
+
+
+def _bench_save_tracker_data(work_dir, size):
+    return _get_service(work_dir, size)._save_tracker_data
+
+
+def _bench_load_tracker_data(work_dir, size):
+    se = _get_service(work_dir, size)
+    se._save_tracker_data()
+    return se._load_tracker_data
+
+
+def _bench_check_uptime(work_dir, size):
+    return _get_service(work_dir, size)._check_uptime
+
+
+def _bench_check_new_volume(work_dir, size):
+    return _get_service(work_dir, size)._check_new_volume
+
+
+def _bench_attempts_history(work_dir, size):
+    return _get_service(work_dir, size)._get_tracker_attempts_history
+
+
+def _bench_attempt_tick(work_dir, size):
+    # a regular not_ready tick: new attempt, checks and tracker save
+    se = _get_service(work_dir, size)
+    se.tracker_data['last_run'] = se.tracker_data['attempts'][-1]
+    attempts = list(se.tracker_data['attempts'])
+
+    def func():
+        se.tracker_data['attempts'] = list(attempts)
+        se._attempt_run()
+
+    return func
+
+
+def _bench_get_display_env(work_dir, size):
+    return service.get_display_env
+
+
+def _bench_is_fullscreen(work_dir, size):
+    return service.is_fullscreen
+
+
+def _bench_notifier_send(work_dir, size):
+    sender = notifier.LinuxNotifier(app_name='bench')
+    return lambda: sender.send('title', 'body', replace_key='key')
+
+
+# name: (setup(work_dir, size) -> callable, sized)
+BENCHMARKS = {
+    'save_tracker_data': (_bench_save_tracker_data, True),
+    'load_tracker_data': (_bench_load_tracker_data, True),
+    'check_uptime': (_bench_check_uptime, True),
+    'check_new_volume': (_bench_check_new_volume, True),
+    'attempts_history': (_bench_attempts_history, True),
+    'attempt_tick': (_bench_attempt_tick, True),
+    'get_display_env': (_bench_get_display_env, False),
+    'is_fullscreen': (_bench_is_fullscreen, False),
+    'notifier_send': (_bench_notifier_send, False),
+}
+
+
+def measure(func, min_time=MIN_TIME, repeat=REPEAT):
+    func()
+    loops = 1
+    while True:
+        start_ts = time.perf_counter()
+        for i in range(loops):
+            func()
+        duration = time.perf_counter() - start_ts
+        if duration >= min_time / repeat or loops >= 1000000:
+            break
+        loops *= 10
+    durations = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            start_ts = time.perf_counter()
+            for j in range(loops):
+                func()
+            durations.append((time.perf_counter() - start_ts) / loops)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    tracemalloc.start()
+    try:
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    return {
+        'min': min(durations),
+        'mean': sum(durations) / len(durations),
+        'loops': loops,
+        'peak_alloc': peak,
+        'alloc_blocks': sum(s.count for s in snapshot.statistics('filename')),
+    }
+
+
+def run_benchmarks(names=None, sizes=None, min_time=MIN_TIME, repeat=REPEAT):
+    res = {}
+    work_dir = tempfile.mkdtemp(prefix='svcutils-bench-')
+    try:
+        with stub_probes(), fake_notify_send(work_dir):
+            for name, (setup, sized) in BENCHMARKS.items():
+                if names and name not in names:
+                    continue
+                for size in (sizes or SIZES) if sized else [None]:
+                    svc_dir = os.path.join(work_dir, f'.{name}-{size}')
+                    os.makedirs(svc_dir, exist_ok=True)
+                    key = f'{name}[{size}]' if sized else name
+                    res[key] = measure(setup(svc_dir, size), min_time=min_time, repeat=repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return res
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    # returns {key: ratios} for results slower or allocating more than the baseline
+    res = {}
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratios = {k: result[k] / base[k] for k in ('min', 'peak_alloc') if base.get(k)}
+        if any(r > 1 + threshold for r in ratios.values()):
+            res[key] = ratios
+    return res
+
+
+def _format_seconds(value):
+    for unit, factor in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if value >= factor:
+            return f'{value / factor:.2f}{unit}'
+    return f'{value / 1e-9:.0f}ns'
+
+
+def format_table(results, baseline=None):
+    header = ['benchmark', 'min', 'mean', 'peak alloc', 'blocks', 'vs baseline']
+    rows = [header]
+    for key, r in results.items():
+        base = (baseline or {}).get(key)
+        rows.append([
+            key,
+            _format_seconds(r['min']),
+            _format_seconds(r['mean']),
+            f'{r["peak_alloc"] / 1024:.1f}KiB',
+            str(r['alloc_blocks']),
+            f'{r["min"] / base["min"]:.2f}x' if base and base.get('min') else '-',
+        ])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header) - 1)]
+    return '\n'.join('  '.join([c.ljust(w) for c, w in zip(row, widths)] + [row[-1]]) for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m svcutils.bench',
+                                     description='benchmark tracker, scheduling and probe hot paths')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='tracker history sizes')
+    parser.add_argument('--min-time', type=float, default=MIN_TIME, help='minimum time per benchmark')
+    parser.add_argument('--baseline', help='compare against this baseline file')
+    parser.add_argument('--save', help='save the results as a baseline file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='regression threshold ratio')
+    parser.add_argument('--json', action='store_true', help='json output')
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.names, args.sizes, min_time=args.min_time)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+    if args.save:
+        with open(args.save, 'w') as fd:
+            json.dump(results, fd, indent=4, sort_keys=True)
+    if args.json:
+        print(json.dumps(results, indent=4, sort_keys=True))
+    else:
+        print(format_table(results, baseline))
+    if baseline:
+        regressions = compare(results, baseline, threshold=args.threshold)
+        for key, ratios in regressions.items():
+            print(f'regression: {key} ' + ' '.join(f'{k}={v:.2f}x' for k, v in ratios.items()),
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
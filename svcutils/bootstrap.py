@@ -1,8 +1,15 @@
 import ctypes
+import hashlib
+import json
 import os
 from pathlib import Path
+import platform
+import shutil
+import socket
 import subprocess
 import sys
+import tarfile
+import tempfile
 import urllib.request
 
 HOME_DIR = os.path.expanduser('~')
@@ -17,6 +24,74 @@ VENV_BIN_DIRNAME = {'linux': 'bin', 'win32': 'Scripts'}[sys.platform]
 VENV_PIP_PATH = {'linux': 'pip', 'win32': 'pip.exe'}[sys.platform]
 VENV_PY_PATH = {'linux': 'python', 'win32': 'python.exe'}[sys.platform]
 VENV_SVC_PY_PATH = {'linux': 'python', 'win32': 'pythonw.exe'}[sys.platform]
+BUNDLE_MANIFEST_FILENAME = 'manifest.json'
+BUNDLE_LOCK_FILENAME = 'requirements.lock'
+BUNDLE_WHEELS_DIRNAME = 'wheels'
+
+
+def get_host_phase(key, period):
+    # stable per host and key, spreads a fleet evenly over the period
+    digest = hashlib.sha1(f'{socket.gethostname()}:{key}'.encode('utf-8')).hexdigest()
+    return int(digest, 16) % max(int(period), 1)
+
+
+def get_bundle_key():
+    # wheels are specific to the python version, the platform and the architecture
+    return f'py{sys.version_info.major}{sys.version_info.minor}-{sys.platform}-{platform.machine().lower()}'
+
+
+def get_file_hash(file):
+    res = hashlib.sha256()
+    with open(file, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+            res.update(chunk)
+    return res.hexdigest()
+
+
+def create_bundle(file, wheels_dir, lock, install_requires=None):
+    # tar.gz with a wheelhouse, the pinned requirements and their sha256
+    with tempfile.TemporaryDirectory() as temp_dir:
+        shutil.copytree(wheels_dir, os.path.join(temp_dir, BUNDLE_WHEELS_DIRNAME))
+        with open(os.path.join(temp_dir, BUNDLE_LOCK_FILENAME), 'w') as fd:
+            fd.write(lock)
+        files = {}
+        for root, dirs, filenames in os.walk(temp_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                files[os.path.relpath(path, temp_dir).replace(os.sep, '/')] = get_file_hash(path)
+        manifest = {'key': get_bundle_key(), 'install_requires': sorted(install_requires or []), 'files': files}
+        with open(os.path.join(temp_dir, BUNDLE_MANIFEST_FILENAME), 'w') as fd:
+            json.dump(manifest, fd, indent=4, sort_keys=True)
+        temp_file = f'{file}.{socket.gethostname()}.{os.getpid()}'
+        with tarfile.open(temp_file, 'w:gz') as tar:
+            for name in sorted(os.listdir(temp_dir)):
+                tar.add(os.path.join(temp_dir, name), arcname=name)
+        os.replace(temp_file, file)
+    return manifest
+
+
+def extract_bundle(file, dst_dir):
+    with tarfile.open(file) as tar:
+        for member in tar.getmembers():
+            path = os.path.realpath(os.path.join(dst_dir, member.name))
+            if not (member.isfile() or member.isdir()) or \
+                    not path.startswith(os.path.realpath(dst_dir) + os.sep):
+                raise SystemExit(f'Error: invalid bundle member {member.name} in {file}')
+        tar.extractall(dst_dir, **({'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}))
+    with open(os.path.join(dst_dir, BUNDLE_MANIFEST_FILENAME)) as fd:
+        manifest = json.load(fd)
+    if manifest['key'] != get_bundle_key():
+        raise SystemExit(f'Error: bundle {file} is for {manifest["key"]}, not {get_bundle_key()}')
+    files = {}
+    for root, dirs, filenames in os.walk(dst_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, dst_dir).replace(os.sep, '/')
+            if name != BUNDLE_MANIFEST_FILENAME:
+                files[name] = get_file_hash(path)
+    if files != manifest['files']:
+        raise SystemExit(f'Error: bundle {file} failed the integrity check')
+    return manifest
 
 
 def get_valid_cwd():
@@ -40,7 +115,7 @@ def get_work_dir(name):
 
 class Bootstrapper:
     def __init__(self, name, install_requires=None, force_reinstall=False, init_cmds=None, extra_cmds=None,
-                 tasks=None, shortcuts=None, assets=None):
+                 tasks=None, shortcuts=None, assets=None, bundle_dir=None, build_bundle=False):
         self.name = name
         self.install_requires = install_requires
         self.force_reinstall = force_reinstall
@@ -49,6 +124,8 @@ class Bootstrapper:
         self.tasks = tasks or []
         self.shortcuts = shortcuts or []
         self.assets = assets or []
+        self.bundle_dir = bundle_dir
+        self.build_bundle = build_bundle
         self.cwd = get_valid_cwd()
         self.work_dir = get_work_dir(self.name)
         self.venv_dir = os.path.join(self.work_dir, VENV_DIRNAME)
@@ -56,6 +133,8 @@ class Bootstrapper:
         self.pip_path = os.path.join(self.venv_bin_dir, VENV_PIP_PATH)
         self.py_path = os.path.join(self.venv_bin_dir, VENV_PY_PATH)
         self.svc_py_path = os.path.join(self.venv_bin_dir, VENV_SVC_PY_PATH)
+        self.bundle_file = os.path.join(self.bundle_dir, f'{self.name}-{get_bundle_key()}.tar.gz') \
+            if self.bundle_dir else None
         self._setup()
 
     def _run_venv_cmds(self, cmds):
@@ -64,16 +143,53 @@ class Bootstrapper:
             print(f'running: {" ".join(venv_cmd)}')
             subprocess.check_call(venv_cmd)
 
+    def _build_bundle(self):
+        lock = subprocess.check_output([self.pip_path, 'freeze', '--exclude-editable'], text=True)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            lock_file = os.path.join(temp_dir, BUNDLE_LOCK_FILENAME)
+            with open(lock_file, 'w') as fd:
+                fd.write(lock)
+            wheels_dir = os.path.join(temp_dir, BUNDLE_WHEELS_DIRNAME)
+            subprocess.check_call([self.pip_path, 'wheel', '--no-deps', '--wheel-dir', wheels_dir, '-r', lock_file])
+            os.makedirs(self.bundle_dir, exist_ok=True)
+            create_bundle(self.bundle_file, wheels_dir, lock, self.install_requires)
+        print(f'created bundle: {self.bundle_file}')
+
+    def _get_bundle(self, temp_dir):
+        if not (self.bundle_file and os.path.exists(self.bundle_file)):
+            return None
+        manifest = extract_bundle(self.bundle_file, temp_dir)
+        if manifest['install_requires'] != sorted(self.install_requires or []):
+            print(f'ignored outdated bundle: {self.bundle_file}')
+            return None
+        return manifest
+
+    def _install_requires(self):
+        base_cmd = [self.pip_path, 'install']
+        if self.force_reinstall:
+            base_cmd.append('--force-reinstall')
+        if not self.build_bundle:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                if self._get_bundle(temp_dir):
+                    # offline install of the pinned wheels
+                    subprocess.check_call(base_cmd + [
+                        '--no-index',
+                        '--find-links', os.path.join(temp_dir, BUNDLE_WHEELS_DIRNAME),
+                        '-r', os.path.join(temp_dir, BUNDLE_LOCK_FILENAME),
+                    ])
+                    print(f'installed bundle: {self.bundle_file}')
+                    return
+        subprocess.check_call(base_cmd + self.install_requires)
+        if self.build_bundle and self.bundle_dir:
+            self._build_bundle()
+
     def _setup_venv(self):
         requires_init = not os.path.exists(self.pip_path)
         if requires_init:
             subprocess.check_call([sys.executable, '-m', 'venv', self.venv_dir])   # requires python3-venv
             print(f'created virtualenv: {self.venv_dir}')
         if self.install_requires:
-            base_cmd = [self.pip_path, 'install']
-            if self.force_reinstall:
-                base_cmd.append('--force-reinstall')
-            subprocess.check_call(base_cmd + self.install_requires)
+            self._install_requires()
         if requires_init and self.init_cmds:
             self._run_venv_cmds(self.init_cmds)
         if self.extra_cmds:
@@ -85,22 +201,30 @@ class Bootstrapper:
             urllib.request.urlretrieve(url, file)
             print(f'created asset: {file}')
 
-    def _generate_crontab_schedule(self, schedule_minutes):
+    def _generate_crontab_schedule(self, schedule_minutes, phase=None):
+        minute, hour = (0, 0) if phase is None else (phase % 60, (phase // 60) % 24)
         match schedule_minutes:
             case _ if schedule_minutes < 2:
                 return '* * * * *'
             case _ if schedule_minutes < 60:
-                return f'*/{schedule_minutes} * * * *'
+                if phase is None:
+                    return f'*/{schedule_minutes} * * * *'
+                return f'{phase % schedule_minutes}-59/{schedule_minutes} * * * *'
             case _ if schedule_minutes < 60 * 24:
                 hours = schedule_minutes // 60
-                return '0 * * * *' if hours == 1 else f'0 */{hours} * * *'
+                if hours == 1:
+                    return f'{minute} * * * *'
+                if phase is None:
+                    return f'{minute} */{hours} * * *'
+                return f'{minute} {hour % hours}-23/{hours} * * *'
             case _:
-                return '0 0 * * *'
+                return f'{minute} {hour} * * *'
 
-    def _setup_linux_crontab(self, cmd, name, schedule_minutes):
+    def _setup_linux_crontab(self, cmd, name, schedule_minutes, spread=False):
         res = subprocess.run(['crontab', '-l'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         current_crontab = res.stdout if res.returncode == 0 else ''
-        new_job = f'{self._generate_crontab_schedule(schedule_minutes)} flock -n /tmp/{name}.lock {cmd}\n'
+        phase = get_host_phase(name, 60 * 24) if spread else None
+        new_job = f'{self._generate_crontab_schedule(schedule_minutes, phase)} flock -n /tmp/{name}.lock {cmd}\n'
         updated_crontab = ''
         job_found = False
         for line in current_crontab.splitlines():
@@ -116,9 +240,13 @@ class Bootstrapper:
             raise SystemExit('Error: failed to update crontab')
         print(f'created crontab job:\n{new_job.strip()}')
 
-    def _setup_windows_task(self, cmd, task_name, schedule_minutes):
+    def _setup_windows_task(self, cmd, task_name, schedule_minutes, spread=False):
         if ctypes.windll.shell32.IsUserAnAdmin() == 0:
             raise SystemExit('Error: must run as admin to update scheduled tasks')
+        extra_args = []
+        if spread:
+            offset = get_host_phase(task_name, 60 * 24) % schedule_minutes
+            extra_args = ['/st', f'{offset // 60:02d}:{offset % 60:02d}']
         subprocess.check_call([
             'schtasks', '/create',
             '/tn', task_name,
@@ -127,15 +255,21 @@ class Bootstrapper:
             '/mo', str(schedule_minutes),
             '/rl', 'highest',
             '/f',
-        ])
+        ] + extra_args)
         print(f'created scheduled task {task_name} with cmd:\n{cmd}')
 
-    def _setup_task(self, name, args, schedule_minutes=2):
+    def _get_control_args(self, args, command):
+        # sends the command to a warm service daemon, runs the module when none is listening
+        return ['svcutils.control', self.work_dir, command, '--fallback'] + args
+
+    def _setup_task(self, name, args, schedule_minutes=2, spread=False, control_command=None):
+        if control_command:
+            args = self._get_control_args(args, control_command)
         cmd = ' '.join([self.svc_py_path, '-m'] + args)
         if sys.platform == 'win32':
-            self._setup_windows_task(cmd=cmd, task_name=name, schedule_minutes=schedule_minutes)
+            self._setup_windows_task(cmd=cmd, task_name=name, schedule_minutes=schedule_minutes, spread=spread)
         else:
-            self._setup_linux_crontab(cmd=cmd, name=name, schedule_minutes=schedule_minutes)
+            self._setup_linux_crontab(cmd=cmd, name=name, schedule_minutes=schedule_minutes, spread=spread)
 
     def _create_windows_shortcut(self, target_path, shortcut_path, arguments='', working_dir='', description=''):
         vbs_content = f"""Set objShell = WScript.CreateObject("WScript.Shell")
@@ -167,7 +301,9 @@ Comment={description}
             fd.write(content)
         subprocess.check_call(['chmod', '+x', shortcut_path])
 
-    def _setup_shortcut(self, name, args, headless=False):
+    def _setup_shortcut(self, name, args, headless=False, control_command=None):
+        if control_command:
+            args = self._get_control_args(args, control_command)
         py_path = self.svc_py_path if headless else self.py_path
         args_str = f'-m {" ".join(args)}'
         if sys.platform == 'win32':
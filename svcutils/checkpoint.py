@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+
+CHECKPOINT_FILENAME = '.svc.checkpoint'
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    # append-only journal of json lines, compacted when it grows
+    def __init__(self, file, max_journal_size=1000, fsync=False):
+        self.file = file
+        self.max_journal_size = max_journal_size
+        self.fsync = fsync
+        self.data = {}
+        self.journal_size = 0
+        self._fd = None
+        self._load()
+
+    def _load(self):
+        is_valid = True
+        try:
+            with open(self.file, encoding='utf-8') as fd:
+                for line in fd:
+                    try:
+                        if not line.endswith('\n'):
+                            raise ValueError('truncated line')
+                        item = json.loads(line)
+                    except ValueError:
+                        logger.warning(f'ignoring invalid checkpoint line in {self.file}')
+                        is_valid = False
+                        continue
+                    if item.get('d'):
+                        self.data.pop(item['k'], None)
+                    else:
+                        self.data[item['k']] = item['v']
+                    self.journal_size += 1
+        except FileNotFoundError:
+            return
+        if not is_valid:
+            # an interrupted write must not corrupt the next appended line
+            self.compact()
+
+    def _write(self, item):
+        if self._fd is None:
+            self._fd = open(self.file, 'a', encoding='utf-8')
+        self._fd.write(json.dumps(item, sort_keys=True) + '\n')
+        self._fd.flush()
+        if self.fsync:
+            os.fsync(self._fd.fileno())
+        self.journal_size += 1
+        if self.journal_size > max(self.max_journal_size, len(self.data) * 2):
+            self.compact()
+
+    def compact(self):
+        self.close()
+        temp_file = f'{self.file}.{os.getpid()}'
+        with open(temp_file, 'w', encoding='utf-8') as fd:
+            for key, value in self.data.items():
+                fd.write(json.dumps({'k': key, 'v': value}, sort_keys=True) + '\n')
+            fd.flush()
+            if self.fsync:
+                os.fsync(fd.fileno())
+        os.replace(temp_file, self.file)
+        self.journal_size = len(self.data)
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def save(self, key, value):
+        self.data[key] = value
+        self._write({'k': key, 'v': value})
+
+    def delete(self, key):
+        if key in self.data:
+            del self.data[key]
+            self._write({'k': key, 'd': True})
+
+    def clear(self):
+        self.close()
+        self.data = {}
+        self.journal_size = 0
+        if os.path.exists(self.file):
+            os.remove(self.file)
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __bool__(self):
+        return bool(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
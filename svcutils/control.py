@@ -0,0 +1,134 @@
+import argparse
+import json
+import logging
+import os
+import select
+import socket
+import sys
+import threading
+
+# stdlib only, imported by tiny clients before any heavy module
+CONTROL_FILENAME = '.svc.sock'
+COMMANDS = {'trigger', 'force', 'status'}
+MAX_MESSAGE_SIZE = 65536
+
+logger = logging.getLogger(__name__)
+
+
+def get_control_file(work_dir):
+    return os.path.join(work_dir, CONTROL_FILENAME)
+
+
+def _read_line(sock):
+    buf = b''
+    while b'\n' not in buf and len(buf) < MAX_MESSAGE_SIZE:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        buf += chunk
+    return buf.split(b'\n', 1)[0].decode('utf-8')
+
+
+def send_command(work_dir, command, timeout=5):
+    # returns the daemon response, None if no daemon is listening
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(get_control_file(work_dir))
+            sock.sendall(f'{command}\n'.encode('utf-8'))
+            return json.loads(_read_line(sock))
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        except (OSError, ValueError) as exc:
+            # timeout, no permission on the socket or a daemon closing without a valid response
+            logger.warning(f'failed to send {command!r} to the daemon: {exc!r}')
+            return None
+
+
+class ControlServer:
+    # listens on a unix socket in the work dir, handler(command) returns a json serializable response
+    def __init__(self, work_dir, handler, timeout=5):
+        self.file = get_control_file(work_dir)
+        self.handler = handler
+        self.timeout = timeout
+        self._sock = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _open(self):
+        # the service lock is held, a leftover socket file is stale
+        if os.path.exists(self.file):
+            os.remove(self.file)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.file)
+        os.chmod(self.file, 0o600)
+        sock.listen(16)
+        return sock
+
+    def _handle(self, conn):
+        with conn:
+            conn.settimeout(self.timeout)
+            try:
+                command = _read_line(conn).strip()
+                if command in COMMANDS:
+                    res = {'ok': True, 'result': self.handler(command)}
+                else:
+                    res = {'ok': False, 'error': f'invalid command {command!r}'}
+            except Exception as exc:
+                logger.exception('failed to handle control command')
+                res = {'ok': False, 'error': str(exc)}
+            try:
+                conn.sendall(f'{json.dumps(res, sort_keys=True)}\n'.encode('utf-8'))
+            except OSError:
+                pass
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([self._sock], [], [], 1)
+            if readable:
+                conn, _ = self._sock.accept()
+                self._handle(conn)
+
+    def start(self):
+        self._sock = self._open()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+            try:
+                os.remove(self.file)
+            except FileNotFoundError:
+                pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m svcutils.control',
+                                     description='send a command to a running service daemon')
+    parser.add_argument('work_dir', help='service work dir')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('--fallback', nargs=argparse.REMAINDER,
+                        help='module and args to run with "python -m" when no daemon is listening')
+    args = parser.parse_args(argv)
+    res = send_command(args.work_dir, args.command)
+    if res is None:
+        if args.fallback:
+            os.execv(sys.executable, [sys.executable, '-m'] + args.fallback)
+        raise SystemExit(f'Error: no daemon listening in {args.work_dir}')
+    print(json.dumps(res, indent=4, sort_keys=True))
+    if not res['ok']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
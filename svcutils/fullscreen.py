@@ -0,0 +1,125 @@
+import logging
+import select
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FullscreenMonitor:
+    # keeps the fullscreen state of the active window up to date from X PropertyNotify events
+    def __init__(self, callback=None, reconnect_delta=10, display_name=None):
+        self.callback = callback
+        self.reconnect_delta = reconnect_delta
+        self.display_name = display_name
+        self.is_fullscreen = False
+        self.is_connected = False
+        self.display = None
+        self.root = None
+        self.window = None
+        self.atoms = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        from Xlib import X, display
+        self.display = display.Display(self.display_name)
+        # property changes on windows we do not own may fail asynchronously
+        self.display.set_error_handler(lambda *args: None)
+        self.root = self.display.screen().root
+        self.atoms = {n: self.display.intern_atom(n) for n in ('_NET_ACTIVE_WINDOW', '_NET_WM_STATE',
+                                                               '_NET_WM_STATE_FULLSCREEN')}
+        self.root.change_attributes(event_mask=X.PropertyChangeMask)
+        self.window = None
+        self.is_connected = True
+
+    def _disconnect(self):
+        self.is_connected = False
+        self.window = None
+        if self.display is not None:
+            try:
+                self.display.close()
+            except Exception:
+                pass
+            self.display = None
+
+    def _get_active_window(self):
+        from Xlib import X
+        prop = self.root.get_full_property(self.atoms['_NET_ACTIVE_WINDOW'], X.AnyPropertyType)
+        if not prop or not len(prop.value) or not prop.value[0]:
+            return None
+        return self.display.create_resource_object('window', prop.value[0])
+
+    def _watch_active_window(self):
+        from Xlib import X
+        window = self._get_active_window()
+        if (window and window.id) == (self.window and self.window.id):
+            return
+        if self.window is not None:
+            self.window.change_attributes(event_mask=X.NoEventMask)
+        if window is not None:
+            window.change_attributes(event_mask=X.PropertyChangeMask)
+        self.window = window
+
+    def _get_state(self):
+        from Xlib import Xatom
+        from Xlib.error import XError
+        try:
+            self._watch_active_window()
+            if self.window is None:
+                return False
+            prop = self.window.get_full_property(self.atoms['_NET_WM_STATE'], Xatom.ATOM)
+        except XError:
+            # the window is gone
+            self.window = None
+            return False
+        return bool(prop) and self.atoms['_NET_WM_STATE_FULLSCREEN'] in prop.value
+
+    def _update(self):
+        state = self._get_state()
+        if state == self.is_fullscreen:
+            return
+        self.is_fullscreen = state
+        logger.info(f'fullscreen is {"on" if state else "off"}')
+        if self.callback:
+            try:
+                self.callback(state)
+            except Exception:
+                logger.exception('fullscreen callback failed')
+
+    def _process_events(self):
+        from Xlib import X
+        watched_atoms = {self.atoms['_NET_ACTIVE_WINDOW'], self.atoms['_NET_WM_STATE']}
+        while not self._stop_event.is_set():
+            if not self.display.pending_events():
+                select.select([self.display.fileno()], [], [], 1)
+            must_update = False
+            for i in range(self.display.pending_events()):
+                event = self.display.next_event()
+                if event.type == X.PropertyNotify and event.atom in watched_atoms:
+                    must_update = True
+            if must_update:
+                self._update()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._connect()
+                self._update()
+                self._process_events()
+            except Exception:
+                logger.exception('fullscreen monitor failed')
+            finally:
+                self._disconnect()
+            self._stop_event.wait(self.reconnect_delta)
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
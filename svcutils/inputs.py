@@ -0,0 +1,308 @@
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import json
+import logging
+import os
+import select
+import stat
+import struct
+import sys
+import threading
+
+INPUTS_FILENAME = '.svc.inputs.json'
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE \
+    | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+# not a valid file name, marks a directory which could not be read
+ERROR_ENTRY = '\0error'
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value):
+    return hashlib.sha1(value.encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+def _get_error_entry(exc):
+    return [False, 0, 0, f'error:{exc.errno}']
+
+
+def _get_entry(st):
+    # the stat fields that change when a file is modified, replaced or moved
+    if stat.S_ISDIR(st.st_mode):
+        return [True, 0, 0, st.st_ino]
+    return [False, st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+class Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add_watch(self, path, mask=WATCH_MASK | IN_ONLYDIR):
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f'inotify_add_watch failed: {os.strerror(err)}', path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        # yields (wd, mask, name)
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size
+                name = data[pos:pos + length].rstrip(b'\0')
+                pos += length
+                yield wd, mask, os.fsdecode(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class InputIndex:
+    # stat based fingerprint of the watched paths with a directory level merkle roll-up,
+    # kept up to date by inotify when watching, by a stat walk otherwise.
+    # only the fingerprint of the last run is persisted, a new process starts with a stat walk
+    def __init__(self, paths, file, use_inotify=True):
+        self.paths = sorted(os.path.abspath(os.path.expanduser(p)) for p in paths)
+        self.file = file
+        self.use_inotify = use_inotify
+        self.entries = {}
+        self.hashes = {}
+        self.run_fingerprint = None
+        self.is_complete = False
+        self.inotify = None
+        self.watches = {}
+        self.watched = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.file) as fd:
+                data = json.load(fd)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get('paths') == self.paths:
+            self.run_fingerprint = data.get('run_fingerprint')
+
+    def _save(self):
+        data = {'paths': self.paths, 'run_fingerprint': self.run_fingerprint}
+        temp_file = f'{self.file}.{os.getpid()}'
+        with open(temp_file, 'w') as fd:
+            json.dump(data, fd, indent=4, sort_keys=True)
+        os.replace(temp_file, self.file)
+
+    def _watch(self, path):
+        if self.inotify is None or path in self.watched:
+            return
+        try:
+            wd = self.inotify.add_watch(path)
+            self.watches[wd] = path
+            self.watched[path] = wd
+        except OSError as exc:
+            if exc.errno not in {errno.ENOENT, errno.ENOTDIR, errno.EACCES}:
+                # most likely out of watches, fall back to stat walks
+                logger.warning(f'failed to watch {path}: {exc}')
+                self._stop_inotify()
+
+    def _remove(self, path):
+        # the subdirs are known from the entries, no need to look at every indexed path
+        entries = self.entries.pop(path, None) or {}
+        self.hashes.pop(path, None)
+        wd = self.watched.pop(path, None)
+        if wd is not None:
+            self.watches.pop(wd, None)
+        for name, entry in entries.items():
+            if entry[0]:
+                self._remove(os.path.join(path, name))
+
+    def _scan(self, path, recursive=True):
+        self._watch(path)
+        entries = {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        entries[entry.name] = _get_entry(entry.stat(follow_symlinks=False))
+                    except FileNotFoundError:
+                        continue
+                    except OSError as exc:
+                        entries[entry.name] = _get_error_entry(exc)
+        except (FileNotFoundError, NotADirectoryError):
+            self._remove(path)
+            return
+        except OSError as exc:
+            # an unreadable directory must not prevent the fingerprint, it changes once readable
+            logger.warning(f'failed to scan {path}: {exc}')
+            entries = {ERROR_ENTRY: _get_error_entry(exc)}
+        for name, old_entry in (self.entries.get(path) or {}).items():
+            if old_entry[0] and not (entries.get(name) or [False])[0]:
+                self._remove(os.path.join(path, name))
+        self.entries[path] = entries
+        self.hashes.pop(path, None)
+        for name, entry in entries.items():
+            subdir = os.path.join(path, name)
+            if entry[0] and (recursive or self._must_scan(subdir)):
+                self._scan(subdir, recursive=recursive)
+
+    def _must_scan(self, path):
+        # new subdirs, unreadable ones are retried on every scan of their parent
+        entries = self.entries.get(path)
+        return entries is None or ERROR_ENTRY in entries
+
+    def _invalidate(self, path):
+        # the hashes of the ancestors depend on this one
+        while path not in self.paths and path != os.path.dirname(path):
+            path = os.path.dirname(path)
+            self.hashes.pop(path, None)
+
+    def _get_hash(self, path):
+        res = self.hashes.get(path)
+        if res is None:
+            items = []
+            for name, entry in sorted(self.entries.get(path, {}).items()):
+                value = self._get_hash(os.path.join(path, name)) if entry[0] else entry
+                items.append(f'{name}:{value}')
+            res = self.hashes[path] = _hash('\n'.join(items))
+        return res
+
+    def _get_root_hash(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._remove(path)
+            return None
+        except OSError as exc:
+            self._remove(path)
+            return _hash(str(_get_error_entry(exc)))
+        if not stat.S_ISDIR(st.st_mode):
+            return _hash(str(_get_entry(st)))
+        if path not in self.entries:
+            self._scan(path)
+        return self._get_hash(path)
+
+    def refresh(self):
+        with self._lock:
+            if self.inotify is None or not self.is_complete:
+                # no events to rely on, walk everything
+                self.entries = {}
+                self.hashes = {}
+                for path in self.paths:
+                    if os.path.isdir(path):
+                        self._scan(path)
+                self.is_complete = self.inotify is not None
+            else:
+                dirty, self._dirty = self._dirty, set()
+                for path in sorted(dirty):
+                    if path in self.entries:
+                        self._scan(path, recursive=False)
+                        self._invalidate(path)
+
+    def get_fingerprint(self):
+        self.refresh()
+        with self._lock:
+            return _hash('\n'.join(f'{p}:{self._get_root_hash(p)}' for p in self.paths))
+
+    def set_run_fingerprint(self, fingerprint):
+        self.run_fingerprint = fingerprint
+        with self._lock:
+            self._save()
+
+    def _on_events(self, events):
+        with self._lock:
+            for wd, mask, name in events:
+                if mask & IN_Q_OVERFLOW:
+                    self.is_complete = False
+                    continue
+                path = self.watches.get(wd)
+                if path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                    if self.watched.get(path) == wd:
+                        self.watched.pop(path)
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    self._dirty.add(os.path.dirname(path) if path not in self.paths else path)
+                    if path in self.paths:
+                        self.is_complete = False
+                else:
+                    self._dirty.add(path)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            inotify = self.inotify
+            if inotify is None:
+                return
+            try:
+                self._on_events(list(inotify.read_events(1)))
+            except OSError:
+                logger.exception('failed to read inotify events')
+                self._stop_event.wait(1)
+
+    def _stop_inotify(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+        self.watches = {}
+        self.watched = {}
+        self.is_complete = False
+
+    def start(self):
+        if self.use_inotify and sys.platform == 'linux':
+            try:
+                self.inotify = Inotify()
+            except (OSError, AttributeError, TypeError):
+                logger.exception('failed to initialize inotify, using stat walks')
+                self.inotify = None
+        self._stop_event.clear()
+        if self.inotify is not None:
+            self.refresh()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._stop_inotify()
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from svcutils.locking import file_lock
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+DEFAULT_TTL = 300
+
+logger = logging.getLogger(__name__)
+
+
+def get_default_owner():
+    # unique per lease object, processes on the same host must not share the ownership
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class Lease:
+    # a renewable lease, the token increases on every change of owner (fencing token)
+    def __init__(self, path, name='leader', ttl=DEFAULT_TTL, owner=None, renew_delta=None):
+        self.path = path
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or get_default_owner()
+        self.renew_delta = renew_delta or ttl / 3
+        self.token = None
+        self.expires_ts = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _transaction(self, update, now):
+        # update(lease, now) returns the new lease or None to leave it unchanged
+        raise NotImplementedError()
+
+    def _update(self, lease, now, renew_only=False):
+        is_owner = lease is not None and lease['owner'] == self.owner
+        if renew_only and not (is_owner and lease['token'] == self.token):
+            return None
+        if lease is not None and not is_owner and lease['expires_ts'] > now:
+            return None
+        token = lease['token'] if is_owner else (lease['token'] if lease else 0) + 1
+        return {'owner': self.owner, 'token': token, 'expires_ts': now + self.ttl}
+
+    def _apply(self, renew_only=False):
+        with self._lock:
+            lease = self._transaction(lambda lease, now: self._update(lease, now, renew_only=renew_only),
+                                      time.time())
+            if lease and lease['owner'] == self.owner:
+                if lease['token'] != self.token:
+                    logger.info(f'acquired lease {self.name} (token={lease["token"]})')
+                self.token = lease['token']
+                self.expires_ts = lease['expires_ts']
+                return True
+            if self.token is not None:
+                logger.warning(f'lost lease {self.name} to {lease and lease["owner"]}')
+            self.token = self.expires_ts = None
+            return False
+
+    def acquire(self):
+        # acquires a free or expired lease, renews it if already held
+        return self._apply()
+
+    def renew(self):
+        return self._apply(renew_only=True)
+
+    def release(self):
+        with self._lock:
+            if self.token is None:
+                return
+            token = self.token
+            self.token = self.expires_ts = None
+
+            def update(lease, now):
+                if lease and lease['owner'] == self.owner and lease['token'] == token:
+                    return {**lease, 'expires_ts': 0}
+                return None
+
+            self._transaction(update, time.time())
+
+    @property
+    def is_held(self):
+        return self.token is not None and time.time() < self.expires_ts
+
+    def _run(self):
+        # heartbeat: keeps renewing while held
+        while not self._stop_event.wait(self.renew_delta):
+            if self.token is None:
+                continue
+            try:
+                self.renew()
+            except Exception:
+                logger.exception(f'failed to renew lease {self.name}')
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+class DirectoryLease(Lease):
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self.file = os.path.join(self.path, f'{self.name}.lease')
+        self.lock_file = f'{self.file}.lock'
+
+    def _transaction(self, update, now):
+        with file_lock(self.lock_file):
+            try:
+                with open(self.file) as fd:
+                    lease = json.load(fd)
+            except (FileNotFoundError, ValueError):
+                lease = None
+            new_lease = update(lease, now)
+            if new_lease is None:
+                return lease
+            temp_file = f'{self.file}.{socket.gethostname()}.{os.getpid()}'
+            with open(temp_file, 'w') as fd:
+                json.dump(new_lease, fd, indent=4, sort_keys=True)
+                fd.flush()
+                os.fsync(fd.fileno())
+            os.replace(temp_file, self.file)
+            return new_lease
+
+
+class SqliteLease(Lease):
+    def _transaction(self, update, now):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS leases '
+                         '(name TEXT PRIMARY KEY, owner TEXT, token INTEGER, expires_ts REAL)')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT owner, token, expires_ts FROM leases WHERE name = ?',
+                                   (self.name,)).fetchone()
+                lease = dict(zip(('owner', 'token', 'expires_ts'), row)) if row else None
+                new_lease = update(lease, now)
+                if new_lease is not None:
+                    conn.execute('INSERT OR REPLACE INTO leases (name, owner, token, expires_ts) VALUES (?, ?, ?, ?)',
+                                 (self.name, new_lease['owner'], new_lease['token'], new_lease['expires_ts']))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            return lease if new_lease is None else new_lease
+        finally:
+            conn.close()
+
+
+def get_lease(options, **defaults):
+    # defaults only apply to the options form, not to Lease objects
+    if not options or isinstance(options, Lease):
+        return options or None
+    if not isinstance(options, dict):
+        options = {'path': options}
+    options = {**defaults, **options}
+    path = options.pop('path')
+    cls = SqliteLease if path.endswith(SQLITE_EXTENSIONS) else DirectoryLease
+    return cls(path, **options)
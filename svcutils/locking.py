@@ -0,0 +1,35 @@
+import contextlib
+import os
+import sys
+
+
+def lock_fd(fd, blocking=False):
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def unlock_fd(fd):
+    if sys.platform == 'win32':
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def file_lock(file):
+    fd = os.open(file, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        lock_fd(fd, blocking=True)
+        try:
+            yield
+        finally:
+            unlock_fd(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,249 @@
+import errno
+import ipaddress
+import logging
+import select
+import selectors
+import socket
+import sys
+import threading
+import time
+
+ONLINE_TARGETS = [
+    ('8.8.8.8', 53),
+    ('1.1.1.1', 443),
+    ('2001:4860:4860::8888', 53),
+    ('2606:4700:4700::1111', 443),
+]
+ONLINE_CACHE_TTL = 10
+RTF_UP = 0x1
+RTF_REJECT = 0x200
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+CONNECT_PENDING_ERRNOS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, 10035}   # 10035: WSAEWOULDBLOCK
+
+logger = logging.getLogger(__name__)
+
+_online_cache = {}
+
+
+def _has_ipv4_default_route():
+    with open('/proc/net/route') as fd:
+        next(fd, None)
+        for line in fd:
+            fields = line.split()
+            if len(fields) < 8:
+                continue
+            if fields[1] == '00000000' and fields[7] == '00000000' and int(fields[3], 16) & RTF_UP:
+                return True
+    return False
+
+
+def _has_ipv6_default_route():
+    with open('/proc/net/ipv6_route') as fd:
+        for line in fd:
+            fields = line.split()
+            if len(fields) < 10 or fields[9] == 'lo':
+                continue
+            flags = int(fields[8], 16)
+            if fields[0] == '0' * 32 and fields[1] == '00' and flags & RTF_UP and not flags & RTF_REJECT:
+                return True
+    return False
+
+
+def has_default_route():
+    # no network i/o, returns None when unknown
+    if sys.platform != 'linux':
+        return None
+    res = None
+    for func in (_has_ipv4_default_route, _has_ipv6_default_route):
+        try:
+            if func():
+                return True
+            res = False
+        except OSError:
+            continue
+    return res
+
+
+def _connect(host, port):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = None
+    try:
+        # fails on hosts without ipv6 support
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        err = sock.connect_ex((host, port))
+    except OSError:
+        if sock is not None:
+            sock.close()
+        return None, False
+    if err == 0:
+        return sock, True
+    if err in CONNECT_PENDING_ERRNOS:
+        return sock, False
+    sock.close()
+    return None, False
+
+
+def probe_targets(targets, timeout=3, stagger=.25):
+    # happy eyeballs: staggered connections, the first success wins
+    pending = list(targets)
+    socks = []
+    selector = selectors.DefaultSelector()
+    deadline = time.monotonic() + timeout
+    next_start_ts = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if pending and now >= next_start_ts:
+                sock, connected = _connect(*pending.pop(0))
+                if connected:
+                    sock.close()
+                    return True
+                if sock:
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    socks.append(sock)
+                    next_start_ts = now + stagger
+                continue
+            if not (socks or pending) or now >= deadline:
+                return False
+            wait = deadline - now
+            if pending:
+                wait = min(wait, max(next_start_ts - now, 0))
+            for key, _ in selector.select(wait):
+                sock = key.fileobj
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    return True
+                selector.unregister(sock)
+                socks.remove(sock)
+                sock.close()
+                # do not wait for the stagger delay when a target fails fast
+                next_start_ts = time.monotonic()
+    finally:
+        for sock in socks:
+            sock.close()
+        selector.close()
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == 'localhost'
+
+
+def is_online(targets=None, port=53, timeout=3, ttl=ONLINE_CACHE_TTL, check_route=True, stagger=.25, host=None):
+    # is_online(host, port) is the legacy single target form
+    if isinstance(targets, str):
+        host, targets = targets, None
+    targets = ((host, port),) if host else tuple(targets or ONLINE_TARGETS)
+    cached = _online_cache.get(targets)
+    if ttl and cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+    # loopback targets do not need a route
+    if check_route and not all(_is_loopback(h) for h, _ in targets) and has_default_route() is False:
+        logger.debug('no default route')
+        res = False
+    else:
+        res = probe_targets(targets, timeout=timeout, stagger=stagger)
+    _online_cache[targets] = (time.monotonic(), res)
+    return res
+
+
+def clear_online_cache():
+    _online_cache.clear()
+
+
+class NetworkWatcher:
+    # calls callback when a default route appears, on rtnetlink events or by polling
+    def __init__(self, callback, debounce=5, poll_delta=30, use_netlink=True):
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_delta = poll_delta
+        self.use_netlink = use_netlink
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _open_netlink(self):
+        if not (self.use_netlink and hasattr(socket, 'AF_NETLINK')):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE))
+            return sock
+        except OSError:
+            logger.exception('failed to open netlink socket, polling instead')
+            return None
+
+    def _wait(self, sock, timeout):
+        # returns True if a netlink message was received
+        if sock is None:
+            self._stop_event.wait(timeout)
+            return False
+        readable, _, _ = select.select([sock], [], [], timeout)
+        if not readable:
+            return False
+        while True:
+            try:
+                sock.recv(65536, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                return True
+            except OSError as exc:
+                if exc.errno != errno.ENOBUFS:
+                    raise
+                # the kernel dropped messages, the state is checked anyway
+                logger.warning(f'netlink messages lost: {exc}')
+                return True
+
+    def _get_state(self):
+        res = has_default_route()
+        return is_online(ttl=0) if res is None else res
+
+    def _run(self):
+        sock = self._open_netlink()
+        state = self._get_state()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    if self._wait(sock, self.poll_delta):
+                        # wait for the links to settle
+                        while self._wait(sock, self.debounce) and not self._stop_event.is_set():
+                            pass
+                except OSError:
+                    logger.exception('failed to read netlink messages, reopening')
+                    sock.close()
+                    sock = None
+                    self._stop_event.wait(1)
+                    sock = self._open_netlink()
+                if self._stop_event.is_set():
+                    break
+                new_state = self._get_state()
+                if new_state and not state and sock is None:
+                    # polling: make sure the route is stable
+                    self._stop_event.wait(self.debounce)
+                    new_state = self._get_state()
+                if new_state and not state and not self._stop_event.is_set():
+                    logger.info('network is up')
+                    clear_online_cache()
+                    try:
+                        self.callback()
+                    except Exception:
+                        logger.exception('network callback failed')
+                state = new_state
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,177 @@
+from collections import Counter
+import contextlib
+import cProfile
+from datetime import datetime
+import glob
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+PROFILE_ENV_VAR = 'SVC_PROFILE'
+PROFILE_DIRNAME = 'profiles'
+COUNTER_FILENAME = '.runs'
+MODES = {'cprofile', 'sampling'}
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    def __init__(self, interval=.01, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _get_stack(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_filename}:{code.co_name}:{frame.f_lineno}')
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _sample(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[self._get_stack(frame)] += 1
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def dump_stats(self, file):
+        # collapsed stacks format, usable with flamegraph tools
+        with open(file, 'w') as fd:
+            for stack, count in self.samples.most_common():
+                fd.write(f'{stack} {count}\n')
+
+
+class Profiler:
+    def __init__(self, path, mode='cprofile', every=1, min_duration=None, trace_memory=False,
+                 interval=.01, max_files=10):
+        if mode not in MODES:
+            raise ValueError(f'invalid profiling mode {mode}')
+        self.path = path
+        self.mode = mode
+        self.every = max(int(every), 1)
+        self.min_duration = min_duration
+        self.trace_memory = trace_memory
+        self.interval = interval
+        self.max_files = max_files
+        self.counter_file = os.path.join(self.path, COUNTER_FILENAME)
+
+    def _get_run_count(self):
+        try:
+            with open(self.counter_file) as fd:
+                return int(fd.read().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _increment_run_count(self):
+        count = self._get_run_count() + 1
+        with open(self.counter_file, 'w') as fd:
+            fd.write(str(count))
+        return count
+
+    def _must_profile(self):
+        if self.every == 1:
+            return True
+        return self._increment_run_count() % self.every == 1
+
+    def _rotate(self, ext):
+        files = sorted(glob.glob(os.path.join(self.path, f'*{ext}')))
+        for file in files[:-self.max_files]:
+            os.remove(file)
+
+    def _save(self, profiler, snapshot, duration):
+        basename = f'{datetime.now().strftime("%Y%m%d%H%M%S%f")}-{int(duration)}s'
+        ext = {'cprofile': '.prof', 'sampling': '.stacks'}[self.mode]
+        file = os.path.join(self.path, f'{basename}{ext}')
+        profiler.dump_stats(file)
+        self._rotate(ext)
+        logger.info(f'saved profile {file}')
+        if snapshot:
+            file = os.path.join(self.path, f'{basename}.mem')
+            with open(file, 'w') as fd:
+                for stat in snapshot.statistics('lineno')[:100]:
+                    fd.write(f'{stat}\n')
+            self._rotate('.mem')
+            logger.info(f'saved memory snapshot {file}')
+
+    @contextlib.contextmanager
+    def profile(self):
+        os.makedirs(self.path, exist_ok=True)
+        if not self._must_profile():
+            yield
+            return
+        profiler = cProfile.Profile() if self.mode == 'cprofile' else SamplingProfiler(self.interval)
+        trace_memory = self.trace_memory and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        start_ts = time.monotonic()
+        if self.mode == 'cprofile':
+            profiler.enable()
+        else:
+            profiler.start()
+        try:
+            yield
+        finally:
+            if self.mode == 'cprofile':
+                profiler.disable()
+            else:
+                profiler.stop()
+            duration = time.monotonic() - start_ts
+            snapshot = None
+            if trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+            if self.min_duration is None or duration >= self.min_duration:
+                try:
+                    self._save(profiler, snapshot, duration)
+                except Exception:
+                    logger.exception('failed to save profile')
+
+
+def parse_options(value):
+    # e.g. "sampling,every=10,min_duration=30,trace_memory=1"
+    if value.strip().lower() in {'', '0', 'false', 'no', 'off'}:
+        return None
+    res = {}
+    for item in value.split(','):
+        key, sep, val = item.strip().partition('=')
+        if not sep:
+            if key in MODES:
+                res['mode'] = key
+            continue
+        if key == 'mode':
+            res[key] = val
+        elif key in {'every', 'max_files'}:
+            res[key] = int(val)
+        elif key in {'min_duration', 'interval'}:
+            res[key] = float(val)
+        elif key == 'trace_memory':
+            res[key] = val.lower() in {'1', 'true', 'yes', 'on'}
+    return res
+
+
+def get_profiler(path, options=None):
+    env_value = os.environ.get(PROFILE_ENV_VAR)
+    if env_value is not None:
+        options = parse_options(env_value)
+    if options is None or options is False:
+        return None
+    if options is True:
+        options = {}
+    return Profiler(path, **options)
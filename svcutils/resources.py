@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+import psutil
+
+from svcutils.locking import file_lock
+
+POOL_FILENAME = 'svcutils-resources.json'
+DEFAULT_CAPACITY = 4
+
+logger = logging.getLogger(__name__)
+
+
+def get_pool_dir():
+    # per user, another user's pool files would not be writable
+    if not hasattr(os, 'getuid'):
+        return tempfile.gettempdir()
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or f'/run/user/{os.getuid()}'
+    if os.path.isdir(runtime_dir) and os.access(runtime_dir, os.W_OK):
+        return runtime_dir
+    res = os.path.join(tempfile.gettempdir(), f'svcutils-{os.getuid()}')
+    os.makedirs(res, mode=0o700, exist_ok=True)
+    return res
+
+
+class ResourcePool:
+    def __init__(self, capacity=DEFAULT_CAPACITY, file=None, starvation_delta=600, waiter_ttl=600):
+        self.capacity = capacity
+        self.file = file or os.path.join(get_pool_dir(), POOL_FILENAME)
+        self.lock_file = f'{self.file}.lock'
+        self.starvation_delta = starvation_delta
+        self.waiter_ttl = waiter_ttl
+
+    def _load(self):
+        try:
+            with open(self.file) as fd:
+                return json.load(fd)
+        except (FileNotFoundError, ValueError):
+            return {'holders': {}, 'waiters': {}}
+
+    def _save(self, data):
+        temp_file = f'{self.file}.{os.getpid()}'
+        with open(temp_file, 'w') as fd:
+            json.dump(data, fd, indent=4, sort_keys=True)
+        os.replace(temp_file, self.file)
+
+    def _cleanup(self, data, now):
+        data['holders'] = {k: v for k, v in data['holders'].items() if psutil.pid_exists(v['pid'])}
+        data['waiters'] = {k: v for k, v in data['waiters'].items() if now - v['ts'] < self.waiter_ttl}
+
+    def _get_holder_key(self, name):
+        return f'{name}:{os.getpid()}'
+
+    def _is_starving(self, waiter, now):
+        return now - waiter['since'] >= self.starvation_delta
+
+    def acquire(self, name, weight=1):
+        weight = min(weight, self.capacity)
+        now = time.time()
+        with file_lock(self.lock_file):
+            data = self._load()
+            self._cleanup(data, now)
+            used = sum(v['weight'] for v in data['holders'].values())
+            waiter = data['waiters'].get(name)
+            since = waiter['since'] if waiter else now
+            # aging: waiters starving for longer than us get the capacity first
+            starving = [k for k, v in data['waiters'].items()
+                        if k != name and v['since'] < since and self._is_starving(v, now)]
+            res = used + weight <= self.capacity and not starving
+            if res:
+                data['waiters'].pop(name, None)
+                data['holders'][self._get_holder_key(name)] = {'pid': os.getpid(), 'weight': weight, 'ts': now}
+            else:
+                data['waiters'][name] = {'weight': weight, 'since': since, 'ts': now}
+                logger.info(f'not enough resources for {name} (weight={weight}, used={used}, '
+                            f'capacity={self.capacity}, starving={starving})')
+            self._save(data)
+            return res
+
+    def release(self, name):
+        with file_lock(self.lock_file):
+            data = self._load()
+            if data['holders'].pop(self._get_holder_key(name), None):
+                self._save(data)
+
+    def get_usage(self):
+        with file_lock(self.lock_file):
+            data = self._load()
+            self._cleanup(data, time.time())
+            return sum(v['weight'] for v in data['holders'].values())
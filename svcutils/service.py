@@ -1,6 +1,5 @@
 import ctypes
 import contextlib
-from datetime import datetime
 import functools
 import importlib.util
 import json
@@ -8,16 +7,34 @@ import logging
 from logging.handlers import RotatingFileHandler
 from math import ceil
 import os
+import random
 import socket
+import sqlite3
 import subprocess
 import sys
+import threading
 import time
 
 import psutil
 
-from svcutils.bootstrap import get_app_dir, get_work_dir   # keep in bootstrap, import from service
+from svcutils.bootstrap import get_app_dir, get_host_phase, get_work_dir   # keep in bootstrap, import from service
+from svcutils.checkpoint import CHECKPOINT_FILENAME, Checkpoint
+from svcutils.control import ControlServer, send_command
+from svcutils.fullscreen import FullscreenMonitor
+from svcutils.leader import get_lease
+from svcutils.locking import lock_fd
+from svcutils.inputs import INPUTS_FILENAME, InputIndex
+from svcutils.network import NetworkWatcher, is_online
+from svcutils.profiling import PROFILE_DIRNAME, get_profiler
+from svcutils.resources import ResourcePool
+from svcutils.tracker import HISTORY_FILENAME, Attempt, History, load_tracker_data, write_tracker_data
+from svcutils.upstream import Upstream, UpstreamWatcher
+from svcutils.worker import PeakRssSampler, get_worker
 
 LOCK_FILENAME = '.svc.lock'
+TRACKER_FILENAME = '.svc.json'
+SKIP_CODES = {'not_ready', 'uptime_too_low', 'fullscreen', 'high_cpu_usage', 'low_memory',
+              'user_active', 'resource_busy', 'circuit_open', 'not_leader', 'inputs_unchanged'}
 
 logger = logging.getLogger(__name__)
 
@@ -124,14 +141,86 @@ def is_fullscreen():
         return False
 
 
-def is_online(host='8.8.8.8', port=53, timeout=3):
+class _XScreenSaverInfo(ctypes.Structure):
+    _fields_ = [
+        ('window', ctypes.c_ulong),
+        ('state', ctypes.c_int),
+        ('kind', ctypes.c_int),
+        ('til_or_since', ctypes.c_ulong),
+        ('idle', ctypes.c_ulong),
+        ('event_mask', ctypes.c_ulong),
+    ]
+
+
+def _get_idle_seconds_xscreensaver():
+    xlib = ctypes.CDLL('libX11.so.6')
+    xss = ctypes.CDLL('libXss.so.1')
+    xlib.XOpenDisplay.restype = ctypes.c_void_p
+    xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+    xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+    xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    xss.XScreenSaverAllocInfo.restype = ctypes.POINTER(_XScreenSaverInfo)
+    xss.XScreenSaverQueryInfo.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XScreenSaverInfo)]
+    display = xlib.XOpenDisplay(None)
+    if not display:
+        return None
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.settimeout(timeout)
-            s.connect((host, port))
-        return True
-    except OSError:
-        return False
+        info = xss.XScreenSaverAllocInfo()
+        if not xss.XScreenSaverQueryInfo(display, xlib.XDefaultRootWindow(display), info):
+            return None
+        res = info.contents.idle / 1000
+        xlib.XFree(info)
+        return res
+    finally:
+        xlib.XCloseDisplay(display)
+
+
+def _get_idle_seconds_logind():
+    session_id = os.environ.get('XDG_SESSION_ID')
+    if not session_id:
+        session_id = subprocess.run(['loginctl', 'show-user', str(os.getuid()), '-p', 'Display', '--value'],
+                                    capture_output=True, text=True, check=True).stdout.strip()
+    if not session_id:
+        return None
+    stdout = subprocess.run(['loginctl', 'show-session', session_id, '-p', 'IdleHint', '-p', 'IdleSinceHint'],
+                            capture_output=True, text=True, check=True).stdout
+    props = dict(line.split('=', 1) for line in stdout.splitlines() if '=' in line)
+    if props.get('IdleHint') != 'yes':
+        return 0
+    return max(time.time() - int(props['IdleSinceHint']) / 1000000, 0)
+
+
+def _get_idle_seconds_linux():
+    if not os.environ.get('DISPLAY'):
+        os.environ.update(get_display_env())
+    for func in (_get_idle_seconds_xscreensaver, _get_idle_seconds_logind):
+        try:
+            res = func()
+        except Exception:
+            continue
+        if res is not None:
+            return res
+    return None
+
+
+def _get_idle_seconds_windows():
+    class LASTINPUTINFO(ctypes.Structure):
+        _fields_ = [('cbSize', ctypes.c_uint), ('dwTime', ctypes.c_uint)]
+
+    info = LASTINPUTINFO()
+    info.cbSize = ctypes.sizeof(info)
+    if not ctypes.windll.user32.GetLastInputInfo(ctypes.byref(info)):
+        return None
+    return ((ctypes.windll.kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000
+
+
+def get_idle_seconds():
+    try:
+        return {'linux': _get_idle_seconds_linux, 'win32': _get_idle_seconds_windows}[sys.platform]()
+    except Exception:
+        logger.exception('failed to get idle seconds')
+        return None
 
 
 def check_cpu_percent(max_percent, interval=1):
@@ -141,6 +230,38 @@ def check_cpu_percent(max_percent, interval=1):
     return True
 
 
+def get_memory_info():
+    if sys.platform == 'linux':
+        # cheaper than psutil
+        try:
+            values = {}
+            with open('/proc/meminfo') as fd:
+                for line in fd:
+                    key, _, value = line.partition(':')
+                    values[key] = int(value.split()[0]) * 1024
+            swap_total = values['SwapTotal']
+            return {
+                'available': values['MemAvailable'],
+                'swap_percent': (swap_total - values['SwapFree']) / swap_total * 100 if swap_total else 0,
+            }
+        except (OSError, KeyError, ValueError, IndexError):
+            pass
+    return {'available': psutil.virtual_memory().available, 'swap_percent': psutil.swap_memory().percent}
+
+
+def check_memory(min_available=None, max_swap_percent=None):
+    if not min_available and max_swap_percent is None:
+        return True
+    info = get_memory_info()
+    if min_available and info['available'] < min_available:
+        logger.info(f'available memory is lower than {min_available} bytes')
+        return False
+    if max_swap_percent is not None and info['swap_percent'] > max_swap_percent:
+        logger.info(f'swap usage is higher than {max_swap_percent}%')
+        return False
+    return True
+
+
 def _list_windows_mountpoint_labels():
     kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
 
@@ -182,31 +303,88 @@ def get_volume_labels():
     return [r for r in list_mountpoint_labels().values() if r]
 
 
-def single_instance(path):
-    lockfile = os.path.join(path, LOCK_FILENAME)
+class InstanceLock:
+    def __init__(self, path, slots=1, timeout=None, poll_delta=.1):
+        self.path = path
+        self.slots = max(int(slots), 1)
+        self.timeout = timeout
+        self.poll_delta = poll_delta
+        self.fd = None
+        self.slot = None
+
+    def _get_file(self, slot):
+        return os.path.join(self.path, LOCK_FILENAME if slot == 0 else f'{LOCK_FILENAME}.{slot}')
+
+    def _acquire_slot(self, slot):
+        file = self._get_file(slot)
+        while True:
+            fd = os.open(file, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                lock_fd(fd)
+            except OSError:
+                os.close(fd)
+                return None
+            try:
+                # the previous owner removes the file on release, after we might have opened it
+                if os.fstat(fd).st_ino == os.stat(file).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        return fd
+
+    def acquire(self):
+        end_ts = time.monotonic() + (self.timeout or 0)
+        while True:
+            for slot in range(self.slots):
+                fd = self._acquire_slot(slot)
+                if fd is not None:
+                    self.fd, self.slot = fd, slot
+                    return True
+            if time.monotonic() >= end_ts:
+                return False
+            time.sleep(self.poll_delta)
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            os.remove(self._get_file(self.slot))
+        except OSError:
+            pass
+        os.close(self.fd)
+        self.fd = self.slot = None
+
+    def get_pids(self):
+        res = []
+        for slot in range(self.slots):
+            try:
+                with open(self._get_file(slot)) as fd:
+                    res.append(int(fd.read().strip()))
+            except (OSError, ValueError):
+                continue
+        return res
+
+    def __enter__(self):
+        if not self.acquire():
+            pids = ', '.join(str(r) for r in self.get_pids())
+            if self.slots == 1:
+                raise SystemExit(f'Another instance (PID={pids}) is running. Exiting.')
+            raise SystemExit(f'{self.slots} instances (PIDs={pids}) are running. Exiting.')
+        return self
 
+    def __exit__(self, *args):
+        self.release()
+
+
+def single_instance(path, slots=1, timeout=None):
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            if os.path.exists(lockfile):
-                with open(lockfile, 'r') as fd:
-                    try:
-                        old_pid = int(fd.read().strip())
-                    except ValueError:
-                        old_pid = None
-                if old_pid and pid_exists(old_pid):
-                    raise SystemExit(f'Another instance (PID={old_pid}) is running. Exiting.')
-                else:
-                    logger.warning('Found a stale lockfile. Removing it.')
-                    os.remove(lockfile)
-            current_pid = os.getpid()
-            with open(lockfile, 'w') as fd:
-                fd.write(str(current_pid))
-            try:
+            with InstanceLock(path, slots=slots, timeout=timeout):
                 return func(*args, **kwargs)
-            finally:
-                if os.path.exists(lockfile):
-                    os.remove(lockfile)
         return wrapper
     return decorator
 
@@ -245,52 +423,245 @@ class RunFile:
             pass
 
 
+def get_upstream(upstream):
+    # a RunFile, a Service, a service work dir or tracker file, or any other file touched on completion
+    if isinstance(upstream, Upstream):
+        return upstream
+    if isinstance(upstream, RunFile):
+        return Upstream(upstream.file)
+    if isinstance(upstream, Service):
+        return Upstream(upstream.tracker_file, is_tracker=True)
+    if os.path.isdir(upstream):
+        return Upstream(os.path.join(upstream, TRACKER_FILENAME), is_tracker=True)
+    return Upstream(upstream, is_tracker=os.path.basename(upstream) == TRACKER_FILENAME)
+
+
+def can_lower_nice(nice):
+    # lowering the niceness back requires CAP_SYS_NICE or a large enough RLIMIT_NICE
+    if sys.platform == 'win32':
+        return True
+    if os.geteuid() == 0:
+        return True
+    try:
+        import resource
+        soft_limit = resource.getrlimit(resource.RLIMIT_NICE)[0]
+    except (ImportError, AttributeError, OSError):
+        return False
+    return soft_limit == resource.RLIM_INFINITY or 20 - soft_limit <= nice
+
+
+class ActivityThrottle:
+    # pauses or renices a running worker while the user is active,
+    # renice uses the idle io class and only lowers the cpu priority when it can be restored
+    def __init__(self, get_idle_seconds, min_idle_seconds, action='pause'):
+        if action not in {'pause', 'renice'}:
+            raise ValueError(f'invalid action {action}')
+        self.get_idle_seconds = get_idle_seconds
+        self.min_idle_seconds = min_idle_seconds
+        self.action = action
+        self.is_throttled = False
+        self._nice = {}
+        self._ionice = {}
+
+    def _renice(self, proc):
+        if sys.platform == 'linux':
+            self._ionice[proc.pid] = proc.ionice()
+            proc.ionice(psutil.IOPRIO_CLASS_IDLE)
+        nice = proc.nice()
+        if not can_lower_nice(nice):
+            logger.info(f'not lowering the cpu priority of PID={proc.pid}, it could not be restored')
+            return
+        self._nice[proc.pid] = nice
+        proc.nice(psutil.IDLE_PRIORITY_CLASS if sys.platform == 'win32' else 19)
+
+    def _restore(self, proc):
+        if proc.pid in self._ionice:
+            ioclass, value = self._ionice.pop(proc.pid)
+            proc.ionice(ioclass, value or None)
+        if proc.pid in self._nice:
+            proc.nice(self._nice.pop(proc.pid))
+
+    def _apply(self, proc, throttle):
+        if self.action == 'pause':
+            if throttle:
+                proc.suspend()
+            else:
+                proc.resume()
+        elif throttle:
+            self._renice(proc)
+        else:
+            self._restore(proc)
+
+    def __call__(self, pid):
+        idle_seconds = self.get_idle_seconds()
+        if idle_seconds is None:
+            return
+        throttle = idle_seconds < self.min_idle_seconds
+        if throttle == self.is_throttled:
+            return
+        logger.info(f'user is {"active" if throttle else "idle"}, {self.action} '
+                    f'{"" if throttle else "un"}throttling worker (PID={pid})')
+        try:
+            proc = psutil.Process(pid)
+            procs = [proc] + proc.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+        for proc in procs:
+            try:
+                self._apply(proc, throttle)
+            except psutil.NoSuchProcess:
+                continue
+            except psutil.AccessDenied:
+                logger.warning(f'failed to {"" if throttle else "un"}throttle worker process (PID={proc.pid})')
+        self.is_throttled = throttle
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=3, base_delta=30, max_delta=3600, factor=2, jitter=.5,
+                 circuit_threshold=None, circuit_delta=3600):
+        self.max_retries = max_retries
+        self.base_delta = base_delta
+        self.max_delta = max_delta
+        self.factor = factor
+        self.jitter = jitter
+        self.circuit_threshold = circuit_threshold
+        self.circuit_delta = circuit_delta
+
+    def get_retry_delta(self, failures):
+        if failures > self.max_retries:
+            return None
+        delta = min(self.base_delta * self.factor ** (failures - 1), self.max_delta)
+        return delta * random.uniform(1 - self.jitter, 1)
+
+    def get_circuit_delta(self, failures):
+        if self.circuit_threshold and failures >= self.circuit_threshold:
+            return self.circuit_delta
+        return None
+
+
+def call_target(target, args, kwargs, checkpoint_file=None, profiler=None):
+    # module level, workers started with spawn or forkserver unpickle it
+    with profiler.profile() if profiler else contextlib.nullcontext():
+        if not checkpoint_file:
+            return target(*args, **kwargs)
+        with Checkpoint(checkpoint_file) as checkpoint:
+            return target(*args, checkpoint=checkpoint, **kwargs)
+
+
 class Service:
     def __init__(self, target, work_dir, args=None, kwargs=None, run_delta=60,
                  min_uptime=None, attempt_delta=120, requires_online=False,
-                 trigger_on_volume_change=False, max_cpu_percent=None):
+                 trigger_on_volume_change=False, max_cpu_percent=None, profile=None,
+                 worker=None, instances=1, lock_timeout=None, resource_weight=None, resource_pool=None,
+                 resource_retry_delta=30, retry_policy=None, spread_runs=False, max_jitter=None,
+                 checkpoint=False, min_available_memory=None, max_swap_percent=None, online_targets=None,
+                 trigger_on_network_change=False, network_debounce=5, monitor_fullscreen=False,
+                 min_idle_seconds=None, idle_source=None, on_user_active=None, clock=None, lease=None,
+                 pass_lease_token=False, control_socket=False, watch_paths=None, upstreams=None, upstream_debounce=1):
         self.target = target
         self.work_dir = work_dir
+        self.name = os.path.basename(os.path.normpath(self.work_dir)).lstrip('.')
         self.args = args or ()
         self.kwargs = kwargs or {}
+        self.clock = clock
         self.run_delta = run_delta
         self.min_uptime = min_uptime
         self.attempt_delta = attempt_delta
         self.requires_online = requires_online
+        self.online_targets = online_targets
         self.trigger_on_volume_change = trigger_on_volume_change
+        self.trigger_on_network_change = trigger_on_network_change
+        self.network_debounce = network_debounce
+        self.monitor_fullscreen = monitor_fullscreen
+        self.fullscreen_monitor = None
+        self.min_idle_seconds = min_idle_seconds
+        self.idle_source = idle_source or get_idle_seconds
+        self.on_user_active = on_user_active
+        self.idle_check_ts = None
         self.max_cpu_percent = max_cpu_percent
-        self.tracker_file = os.path.join(self.work_dir, '.svc.json')
+        self.min_available_memory = min_available_memory
+        self.max_swap_percent = max_swap_percent
+        self.profiler = get_profiler(os.path.join(self.work_dir, PROFILE_DIRNAME), profile)
+        self.worker = get_worker(worker)
+        self.instances = instances
+        self.lock_timeout = lock_timeout
+        self.resource_weight = resource_weight
+        self.resource_pool = (resource_pool or ResourcePool()) if resource_weight else None
+        self.resource_retry_delta = resource_retry_delta
+        self.resources_acquired = False
+        self.retry_policy = retry_policy
+        if lease and instances > 1:
+            raise ValueError('a lease requires a single instance')
+        # the control socket file would be replaced by each instance
+        if control_socket and instances > 1:
+            raise ValueError('a control socket requires a single instance')
+        # one lease per service, owned by this service on this host across runs
+        self.lease = get_lease(lease, name=self.name,
+                               owner=f'{socket.gethostname()}:{os.path.abspath(self.work_dir)}')
+        self.pass_lease_token = pass_lease_token
+        self.control_socket = control_socket
+        self.is_running = False
+        self.input_index = InputIndex(watch_paths, os.path.join(self.work_dir, INPUTS_FILENAME)) \
+            if watch_paths else None
+        self.inputs_fingerprint = None
+        self.upstreams = [get_upstream(u) for u in upstreams or []]
+        self.upstream_debounce = upstream_debounce
+        self.upstream_ts = None
+        self.spread_runs = spread_runs
+        self.max_jitter = max_jitter
+        self.checkpoint = checkpoint
+        self.checkpoint_file = os.path.join(self.work_dir, CHECKPOINT_FILENAME)
+        self.tracker_file = os.path.join(self.work_dir, TRACKER_FILENAME)
+        self.history = History(os.path.join(self.work_dir, HISTORY_FILENAME))
         self.tracker_data = self._load_tracker_data()
+        self.tracker_data['settings'] = {'run_delta': self.run_delta, 'attempt_delta': self.attempt_delta}
         self.uptime_precision = int(ceil(self.attempt_delta * 1.5))
         self.check_delta = self.min_uptime + self.uptime_precision if self.min_uptime else None
+        self.wake_reasons = set()
+        self._pending_wake_reasons = set()
+        self._wake_event = threading.Event()
+        self._wake_lock = threading.Lock()
+        self._watchers = []
+
+    def _now(self):
+        return self.clock() if self.clock else time.time()
 
     def _load_tracker_data(self):
         try:
             with open(self.tracker_file) as fd:
-                return json.load(fd)
+                return load_tracker_data(json.load(fd))
         except FileNotFoundError:
             return {'attempts': [], 'last_run': None}
 
     def _get_tracker_attempts_history(self):
         if self.tracker_data['last_run']:
-            begin = self.tracker_data['last_run']['ts'] - (self.check_delta or 0)
+            begin = self.tracker_data['last_run'].ts - (self.check_delta or 0)
         else:
-            begin = time.time() - self.run_delta * 2
-        return [a for a in self.tracker_data['attempts'] if a['ts'] >= begin]
+            begin = self._now() - self.run_delta * 2
+        return [a for a in self.tracker_data['attempts'] if a.ts >= begin]
 
     def _generate_tracker_attempt(self):
-        now = datetime.now()
-        return {
-            'ts': now.timestamp(),
-            'dt': now.isoformat(),
-            'is_online': is_online() if self.requires_online else None,
-            'volume_labels': get_volume_labels() if self.trigger_on_volume_change else None,
-            'code': None,
-        }
+        return Attempt(
+            ts=self._now(),
+            is_online=is_online(self.online_targets) if self.requires_online else None,
+            volume_labels=get_volume_labels() if self.trigger_on_volume_change else None,
+        )
 
     def _save_tracker_data(self):
-        with open(self.tracker_file, 'w') as fd:
-            json.dump(self.tracker_data, fd, indent=4, sort_keys=True)
+        # instances share the tracker file: the replace is atomic but the last writer wins,
+        # updates from concurrent instances (last_run, failures) can be lost
+        temp_file = f'{self.tracker_file}.{os.getpid()}'
+        with open(temp_file, 'w') as fd:
+            write_tracker_data(self.tracker_data, fd)
+        os.replace(temp_file, self.tracker_file)
+
+    def _append_history(self):
+        if not self.tracker_data['attempts']:
+            return
+        try:
+            self.history.append(self.tracker_data['attempts'][-1])
+        except OSError:
+            logger.exception('failed to append to the run history')
 
     @contextlib.contextmanager
     def _update_tracker_data(self, new_attempt=True):
@@ -310,76 +681,377 @@ class Service:
     def _check_new_volume(self):
         if not (self.trigger_on_volume_change and self.tracker_data['last_run'] and self.tracker_data['attempts']):
             return False
-        current_volumes = set(self.tracker_data['attempts'][-1]['volume_labels'] or [])
-        dedup_attempts_tuples = set(tuple(sorted(a['volume_labels'] or []))
-                                    for a in reversed(self.tracker_data['attempts'])
-                                    if a['ts'] >= self.tracker_data['last_run']['ts'])
-        for t in dedup_attempts_tuples:
-            if not current_volumes.issubset(set(t)):
-                return True
-        return False
+        current_volumes = self.tracker_data['attempts'][-1].volume_labels or frozenset()
+        last_run_ts = self.tracker_data['last_run'].ts
+        # interned label sets, most attempts share the same few
+        dedup_volumes = {a.volume_labels for a in self.tracker_data['attempts'] if a.ts >= last_run_ts}
+        return any(not current_volumes <= (v or frozenset()) for v in dedup_volumes)
 
     def _check_uptime(self):
         if not self.check_delta:
             return True
-        now = time.time()
-        if self.tracker_data['last_run'] and now - self.tracker_data['last_run'].get('end_ts', 0) < self.check_delta:
+        now = self._now()
+        if self.tracker_data['last_run'] and now - (self.tracker_data['last_run'].end_ts or 0) < self.check_delta:
             return True
-        tds = [int(i['ts'] - now) for i in self.tracker_data['attempts']
-               if i['ts'] > now - self.check_delta and (i['is_online'] or not self.requires_online)]
+        # the network watcher already waited for the network to be stable
+        requires_online = self.requires_online and 'network' not in self.wake_reasons
+        tds = [int(i.ts - now) for i in self.tracker_data['attempts']
+               if i.ts > now - self.check_delta and (i.is_online or not requires_online)]
         values = {int((r + self.check_delta) // self.uptime_precision) for r in tds}
         expected = set(range(0, int(ceil(self.check_delta / self.uptime_precision))))
         res = values >= expected
         if not res:
-            logger.info(f'{"online " if self.requires_online else ""}uptime is less than {self.min_uptime} seconds')
+            logger.info(f'{"online " if requires_online else ""}uptime is less than {self.min_uptime} seconds')
+        return res
+
+    def _get_next_run_ts(self):
+        if not self.tracker_data['last_run']:
+            return 0
+        last_run_ts = self.tracker_data['last_run'].ts
+        # a skip for unchanged inputs counts as a run for scheduling
+        last_run_ts = max(last_run_ts, self.tracker_data.get('inputs_checked_ts') or 0)
+        res = last_run_ts + self.run_delta
+        if self.spread_runs:
+            # align runs on this host's slot, at least half a period after the last run
+            phase = get_host_phase(self.name, self.run_delta)
+            min_ts = last_run_ts + self.run_delta / 2
+            res = ceil((min_ts - phase) / self.run_delta) * self.run_delta + phase
+        if self.max_jitter:
+            # seeded with the last run so the jitter is stable between attempts
+            seed = f'{socket.gethostname()}:{self.name}:{last_run_ts}'
+            res += random.Random(seed).uniform(0, self.max_jitter)
         return res
 
+    def _must_resume(self):
+        # an interrupted run left a checkpoint, failed runs follow the retry policy
+        if not self.checkpoint or self.tracker_data.get('failures'):
+            return False
+        return os.path.exists(self.checkpoint_file) and os.path.getsize(self.checkpoint_file) > 0
+
+    def _is_circuit_open(self):
+        failures = self.tracker_data.get('failures')
+        if failures and failures.get('circuit_ts') and self._now() < failures['circuit_ts']:
+            logger.info(f'circuit is open after {failures["count"]} consecutive failures')
+            return True
+        return False
+
+    def _is_retry_due(self):
+        failures = self.tracker_data.get('failures')
+        if not failures:
+            return False
+        if 'network' in self.wake_reasons and failures.get('retry_ts'):
+            # shortens a pending backoff only, not exhausted retries or an open circuit
+            return True
+        ts = failures.get('retry_ts') or failures.get('circuit_ts')
+        return bool(ts) and self._now() >= ts
+
+    def _update_failures(self, failed):
+        if not failed:
+            self.tracker_data['failures'] = None
+            return
+        count = (self.tracker_data.get('failures') or {}).get('count', 0) + 1
+        now = self._now()
+        retry_delta = circuit_delta = None
+        if self.retry_policy:
+            retry_delta = self.retry_policy.get_retry_delta(count)
+            circuit_delta = self.retry_policy.get_circuit_delta(count)
+        self.tracker_data['failures'] = {
+            'count': count,
+            'retry_ts': now + retry_delta if retry_delta is not None and not circuit_delta else None,
+            'circuit_ts': now + circuit_delta if circuit_delta else None,
+        }
+        if circuit_delta:
+            logger.error(f'opening circuit for {circuit_delta} seconds after {count} consecutive failures')
+        elif retry_delta is not None:
+            logger.info(f'retrying in {retry_delta:.1f} seconds after {count} consecutive failures')
+
+    def _is_fullscreen(self):
+        if self.fullscreen_monitor and self.fullscreen_monitor.is_connected:
+            return self.fullscreen_monitor.is_fullscreen
+        return is_fullscreen()
+
+    def _on_fullscreen_change(self, state):
+        attempts = self.tracker_data['attempts']
+        if not state and attempts and attempts[-1].code == 'fullscreen':
+            self.wake('fullscreen_end')
+
+    def _check_idle(self):
+        self.idle_check_ts = None
+        if not self.min_idle_seconds:
+            return True
+        idle_seconds = self.idle_source()
+        if idle_seconds is None or idle_seconds >= self.min_idle_seconds:
+            return True
+        logger.info(f'user idle time is less than {self.min_idle_seconds} seconds')
+        # check again as soon as the user might be idle long enough
+        self.idle_check_ts = self._now() + self.min_idle_seconds - idle_seconds
+        return False
+
+    def _check_inputs(self):
+        if not self.input_index:
+            return True
+        self.inputs_fingerprint = self.input_index.get_fingerprint()
+        # failed and interrupted runs must complete whatever the inputs
+        if self.tracker_data.get('failures') or self._must_resume() \
+                or self.inputs_fingerprint != self.input_index.run_fingerprint:
+            return True
+        logger.info('watched inputs did not change since the last run')
+        self.tracker_data['inputs_checked_ts'] = self._now()
+        self._consume_upstreams()
+        return False
+
+    def _is_upstream_done(self):
+        if not self.upstreams:
+            return False
+        ref_ts = self.tracker_data.get('upstream_ts')
+        if ref_ts is None:
+            ref_ts = self.tracker_data['last_run'].ts if self.tracker_data['last_run'] else 0
+        return self.upstream_ts > ref_ts
+
+    def _consume_upstreams(self):
+        # completions seen before this point are handled, later ones trigger another run
+        if self.upstreams:
+            self.tracker_data['upstream_ts'] = self.upstream_ts
+
+    def _acquire_resources(self):
+        if self.resource_pool:
+            try:
+                self.resources_acquired = self.resource_pool.acquire(self.name, self.resource_weight)
+            except OSError:
+                # an unusable pool must not block the service forever
+                logger.exception('failed to acquire resources, running without admission control')
+                return True
+            return self.resources_acquired
+        return True
+
+    def _release_resources(self):
+        if self.resources_acquired:
+            self.resources_acquired = False
+            try:
+                self.resource_pool.release(self.name)
+            except OSError:
+                logger.exception('failed to release resources')
+
+    def _acquire_lease(self):
+        # renewed on every attempt so the leadership sticks to a live host
+        try:
+            return self.lease.acquire()
+        except (OSError, sqlite3.Error):
+            # an unreachable lease store does not make us the leader
+            logger.exception(f'failed to acquire lease {self.lease.name}')
+            return False
+
     def _must_run(self, force=False):
         with self._update_tracker_data(new_attempt=True):
+            self.inputs_fingerprint = None
+            self.upstream_ts = max(u.get_ts() for u in self.upstreams) if self.upstreams else None
+            if not force and self._is_circuit_open():
+                self._update_attempt(code='circuit_open')
+                return False
+            # forced runs too, a single host may run
+            if self.lease and not self._acquire_lease():
+                self._update_attempt(code='not_leader')
+                return False
             if not force:
-                last_run_ts = self.tracker_data['last_run']['ts'] if self.tracker_data['last_run'] else 0
-                is_ready = time.time() >= last_run_ts + self.run_delta
+                is_ready = self._now() >= self._get_next_run_ts() or self._is_upstream_done() \
+                    or self._is_retry_due() or self._must_resume()
                 if not (is_ready or self._check_new_volume()):
                     self._update_attempt(code='not_ready')
                     return False
                 if not self._check_uptime():
                     self._update_attempt(code='uptime_too_low')
                     return False
-                if is_fullscreen():
+                if self._is_fullscreen():
                     self._update_attempt(code='fullscreen')
                     return False
                 if not check_cpu_percent(self.max_cpu_percent):
                     self._update_attempt(code='high_cpu_usage')
                     return False
+                if not check_memory(self.min_available_memory, self.max_swap_percent):
+                    self._update_attempt(code='low_memory')
+                    return False
+                if not self._check_idle():
+                    self._update_attempt(code='user_active')
+                    return False
+                if not self._acquire_resources():
+                    self._update_attempt(code='resource_busy')
+                    return False
+                # last, hashing the inputs is the costly check, a new volume triggers the run whatever the inputs
+                if is_ready and not self._check_inputs():
+                    self._update_attempt(code='inputs_unchanged')
+                    return False
+            if self.input_index and self.inputs_fingerprint is None:
+                self.inputs_fingerprint = self.input_index.get_fingerprint()
+            self._consume_upstreams()
+            if self.lease and self.lease.token is not None:
+                # fencing token, downstream writes can reject stale leaders
+                self._update_attempt(lease_token=self.lease.token)
             self._update_attempt(code='ready')
             self._update_last_run()
             return True
 
+    def _get_target_args(self):
+        # picklable, the service itself holds locks and events
+        kwargs = dict(self.kwargs)
+        if self.pass_lease_token:
+            kwargs['lease_token'] = self.lease.token if self.lease else None
+        return (self.target, self.args, kwargs, self.checkpoint_file if self.checkpoint else None,
+                self.profiler)
+
+    def _call_target(self):
+        return call_target(*self._get_target_args())
+
+    def _run_target(self):
+        if self.worker:
+            on_wait = None
+            if self.on_user_active and self.min_idle_seconds:
+                on_wait = ActivityThrottle(self.idle_source, self.min_idle_seconds, action=self.on_user_active)
+            return self.worker.run(call_target, args=self._get_target_args(), on_wait=on_wait)
+        with PeakRssSampler() as sampler:
+            try:
+                self._call_target()
+            except Exception as exc:
+                logger.exception('target failed')
+                return {'code': 'failed', 'error': repr(exc), 'peak_rss': sampler.stop()}
+        return {'code': None, 'peak_rss': sampler.peak_rss}
+
+    def _run_and_update(self):
+        self.is_running = True
+        try:
+            res = self._run_target()
+        finally:
+            self.is_running = False
+            self._release_resources()
+        if not self.tracker_data['last_run']:
+            return
+        with self._update_tracker_data(new_attempt=False):
+            if res['code']:
+                self._update_attempt(**res)
+                self._update_failures(failed=True)
+            else:
+                self._update_attempt(end_ts=self._now(), **{k: v for k, v in res.items() if k != 'code'})
+                self._update_last_run()
+                self._update_failures(failed=False)
+                if self.input_index:
+                    # changes made during the run trigger the next one
+                    self.input_index.set_run_fingerprint(self.inputs_fingerprint)
+                if self.checkpoint:
+                    Checkpoint(self.checkpoint_file).clear()
+
     def _attempt_run(self, force=False):
         try:
-            if self._must_run(force):
-                self.target(*self.args, **self.kwargs)
-                if self.tracker_data['last_run']:
-                    with self._update_tracker_data(new_attempt=False):
-                        now = datetime.now()
-                        self._update_attempt(end_ts=now.timestamp(), end_dt=now.isoformat())
-                        self._update_last_run()
+            try:
+                if self._must_run(force):
+                    self._run_and_update()
+            finally:
+                # also when the attempt fails between the acquisition and the run
+                self._release_resources()
+            # once finished, runs are recorded after they end
+            self._append_history()
         except Exception:
             logger.exception('service failed')
 
+    def _get_sleep_delta(self):
+        res = self.attempt_delta
+        if self.tracker_data['attempts'] and self.tracker_data['attempts'][-1].code == 'resource_busy':
+            res = min(res, self.resource_retry_delta)
+        failures = self.tracker_data.get('failures') or {}
+        now = self._now()
+        for ts in (self._get_next_run_ts(), failures.get('retry_ts'), failures.get('circuit_ts'),
+                   self.idle_check_ts):
+            if ts and ts > now:
+                res = min(res, ts - now)
+        return res
+
+    def _on_control_command(self, command):
+        if command == 'status':
+            attempts = self.tracker_data['attempts']
+            last_run = self.tracker_data['last_run']
+            return {
+                'name': self.name,
+                'pid': os.getpid(),
+                'is_running': self.is_running,
+                'last_attempt': attempts[-1].to_dict() if attempts else None,
+                'last_run': last_run.to_dict() if last_run else None,
+                'next_run_ts': self._get_next_run_ts(),
+            }
+        self.wake(command)
+        return command
+
     def run_once(self, force=False):
-        @single_instance(self.work_dir)
+        if self.control_socket and sys.platform != 'win32':
+            # a warm daemon is already listening, let it run
+            res = send_command(self.work_dir, 'force' if force else 'trigger')
+            if res and res['ok']:
+                logger.info(f'sent {res["result"]} to the service daemon')
+                return
+
+        @single_instance(self.work_dir, slots=self.instances, timeout=self.lock_timeout)
         def run():
-            self._attempt_run(force)
+            if self.lease:
+                self.lease.start()
+            try:
+                self._attempt_run(force)
+            finally:
+                if self.lease:
+                    self.lease.stop()
 
         run()
 
+    def wake(self, reason):
+        with self._wake_lock:
+            self._pending_wake_reasons.add(reason)
+        self._wake_event.set()
+
+    def _pop_wake_reasons(self):
+        with self._wake_lock:
+            res, self._pending_wake_reasons = self._pending_wake_reasons, set()
+        return res
+
+    def _sleep(self, delta):
+        logger.debug(f'sleeping for {delta} seconds')
+        if self._wake_event.wait(delta):
+            logger.debug(f'woken up by {", ".join(sorted(self._pending_wake_reasons))}')
+        self._wake_event.clear()
+
+    def _start_watchers(self):
+        if self.trigger_on_network_change:
+            self._watchers.append(NetworkWatcher(callback=lambda: self.wake('network'),
+                                                 debounce=self.network_debounce).start())
+        if self.monitor_fullscreen and sys.platform == 'linux':
+            if not os.environ.get('DISPLAY'):
+                os.environ.update(get_display_env())
+            self.fullscreen_monitor = FullscreenMonitor(callback=self._on_fullscreen_change).start()
+            self._watchers.append(self.fullscreen_monitor)
+        if self.lease:
+            self._watchers.append(self.lease.start())
+        if self.input_index:
+            self._watchers.append(self.input_index.start())
+        if self.upstreams:
+            self._watchers.append(UpstreamWatcher(self.upstreams, callback=lambda: self.wake('upstream'),
+                                                  debounce=self.upstream_debounce).start())
+        if self.control_socket and sys.platform != 'win32':
+            self._watchers.append(ControlServer(self.work_dir, self._on_control_command).start())
+
+    def _stop_watchers(self):
+        for watcher in self._watchers:
+            watcher.stop()
+        self._watchers = []
+        self.fullscreen_monitor = None
+
     def run(self):
-        @single_instance(self.work_dir)
+        @single_instance(self.work_dir, slots=self.instances, timeout=self.lock_timeout)
         def run():
-            while True:
-                self._attempt_run()
-                logger.debug(f'sleeping for {self.attempt_delta} seconds')
-                time.sleep(self.attempt_delta)
+            self._start_watchers()
+            try:
+                while True:
+                    self.wake_reasons = self._pop_wake_reasons()
+                    self._attempt_run(force='force' in self.wake_reasons)
+                    self._sleep(self._get_sleep_delta())
+            finally:
+                self._stop_watchers()
+                if self.lease:
+                    # let another host take over without waiting for the expiry
+                    self.lease.release()
 
         run()
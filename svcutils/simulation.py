@@ -0,0 +1,153 @@
+import argparse
+from bisect import bisect_right
+from collections import Counter
+import contextlib
+import json
+import tempfile
+from unittest.mock import patch
+
+from svcutils import service
+from svcutils.stats import PERCENTILES, get_percentile
+from svcutils.tracker import dump_tracker_data
+
+DAY = 86400
+START_TS = 1700000000.
+PROBES = {'online', 'volumes', 'fullscreen', 'cpu_percent', 'fails'}
+
+
+class Clock:
+    def __init__(self, ts=START_TS):
+        self.ts = ts
+
+    def __call__(self):
+        return self.ts
+
+    def advance(self, delta):
+        self.ts += max(delta, 0)
+
+
+class Timeline:
+    # a step function of the simulated time, steps are (offset, value), repeated every period
+    def __init__(self, steps, period=None, default=None):
+        self.steps = sorted(steps, key=lambda x: x[0])
+        self.offsets = [s[0] for s in self.steps]
+        self.period = period
+        self.default = default
+
+    def get(self, offset):
+        if self.period:
+            offset %= self.period
+        index = bisect_right(self.offsets, offset)
+        return self.steps[index - 1][1] if index else self.default
+
+
+class SimulatedService(service.Service):
+    def __init__(self, *args, clock, probes, target_duration=0, measure_io=True, **kwargs):
+        self.measure_io = measure_io
+        self.saves = 0
+        self.saved_bytes = 0
+        super().__init__(*args, clock=clock, **kwargs)
+        self.start_ts = clock()
+        self.probes = probes
+        self.target_duration = target_duration
+
+    def get_probe(self, name):
+        timeline = self.probes.get(name)
+        return timeline.get(self.clock() - self.start_ts) if timeline else None
+
+    def _load_tracker_data(self):
+        return {'attempts': [], 'last_run': None}
+
+    def _save_tracker_data(self):
+        # compact size, indenting would not use the c encoder and dominate the simulation time
+        self.saves += 1
+        if self.measure_io:
+            self.saved_bytes += len(json.dumps(dump_tracker_data(self.tracker_data), separators=(',', ':')))
+
+    def _append_history(self):
+        pass
+
+    def _run_target(self):
+        failed = self.get_probe('fails')
+        self.clock.advance(self.target_duration)
+        return {'code': 'failed' if failed else None}
+
+
+@contextlib.contextmanager
+def _patch_probes(se):
+    with patch.object(service, 'is_online', side_effect=lambda *args: bool(se.get_probe('online'))), \
+            patch.object(service, 'get_volume_labels', side_effect=lambda: list(se.get_probe('volumes') or [])), \
+            patch.object(service, 'is_fullscreen', side_effect=lambda: bool(se.get_probe('fullscreen'))), \
+            patch.object(service, 'check_cpu_percent',
+                         side_effect=lambda max_percent: not max_percent
+                         or (se.get_probe('cpu_percent') or 0) <= max_percent):
+        yield
+
+
+def get_timelines(probes, defaults=True):
+    # probes: {name: value, [[offset, value], ...] or {'steps': ..., 'period': ...}}
+    res = {'online': Timeline([], default=True)} if defaults else {}
+    for name, value in (probes or {}).items():
+        if name not in PROBES:
+            raise ValueError(f'invalid probe {name}')
+        if isinstance(value, Timeline):
+            res[name] = value
+        elif isinstance(value, dict):
+            res[name] = Timeline(value['steps'], period=value.get('period'), default=value.get('default'))
+        elif isinstance(value, list):
+            res[name] = Timeline(value)
+        else:
+            res[name] = Timeline([], default=value)
+    return res
+
+
+def simulate(duration, probes=None, target_duration=0, start_ts=START_TS, measure_io=True, **service_kwargs):
+    clock = Clock(start_ts)
+    end_ts = start_ts + duration
+    codes = Counter()
+    latencies = []
+    attempts = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        se = SimulatedService(target=lambda: None, work_dir=work_dir, clock=clock, probes=get_timelines(probes),
+                              target_duration=target_duration, measure_io=measure_io, **service_kwargs)
+        with _patch_probes(se):
+            while clock() < end_ts:
+                # the time the next run became due, to measure how late it actually starts
+                due_ts = max(se._get_next_run_ts(), start_ts)
+                se._attempt_run()
+                attempt = se.tracker_data['attempts'][-1]
+                attempts += 1
+                codes[attempt.code] += 1
+                if attempt.code not in service.SKIP_CODES:
+                    latencies.append(max(attempt.ts - due_ts, 0))
+                clock.advance(se._get_sleep_delta())
+    latencies.sort()
+    return {
+        'duration': duration,
+        'attempts': attempts,
+        'runs': len(latencies),
+        'codes': dict(codes.most_common()),
+        'latency_percentiles': {f'p{p}': get_percentile(latencies, p) for p in PERCENTILES},
+        'max_latency': latencies[-1] if latencies else None,
+        'tracker_saves': se.saves,
+        'tracker_bytes': se.saved_bytes if measure_io else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m svcutils.simulation',
+                                     description='replay service attempts with a simulated clock')
+    parser.add_argument('config', help='json file with "service" kwargs, "probes", "days" and "target_duration"')
+    parser.add_argument('--days', type=float, help='simulated days (overrides the config)')
+    parser.add_argument('--no-io', action='store_true', help='do not measure the tracker size')
+    args = parser.parse_args(argv)
+    with open(args.config) as fd:
+        config = json.load(fd)
+    res = simulate(duration=(args.days or config.get('days', 30)) * DAY, probes=config.get('probes'),
+                   target_duration=config.get('target_duration', 0), measure_io=not args.no_io,
+                   **config.get('service', {}))
+    print(json.dumps(res, indent=4, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import argparse
+from collections import Counter
+import glob
+import json
+from math import ceil
+import os
+import sys
+
+from svcutils.bootstrap import HOME_DIR
+from svcutils.service import SKIP_CODES, TRACKER_FILENAME
+from svcutils.tracker import HISTORY_FILENAME, History
+
+WHITESPACE = ' \t\r\n'
+PERCENTILES = [50, 90, 99]
+
+
+class TrackerReader:
+    def __init__(self, fd, chunk_size=65536):
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.fd.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError('unexpected end of data')
+
+    def _next(self, chars):
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(f'unexpected character {char!r} at position {self.pos}')
+        self.pos += 1
+        return char
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number at the end of the buffer might be truncated
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def _iter_array(self):
+        self._next('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self._decode()
+            if self._next(',]') == ']':
+                return
+
+    def __iter__(self):
+        # yields (key, value) for top-level items and (key, item) for each attempt
+        self._next('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._decode()
+            self._next(':')
+            if key == 'attempts' and self._peek() == '[':
+                for attempt in self._iter_array():
+                    yield key, attempt
+            else:
+                yield key, self._decode()
+            if self._next(',}') == '}':
+                return
+
+
+def get_percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = max(int(ceil(percent / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[index]
+
+
+def get_median(values):
+    return get_percentile(sorted(values), 50)
+
+
+class ServiceStats:
+    def __init__(self, name, file):
+        self.name = name
+        self.file = file
+        self.settings = {}
+        self.attempts = 0
+        self.codes = Counter()
+        self.durations = []
+        self.intervals = []
+        self.max_peak_rss = None
+        self.first_ts = None
+        self.last_ts = None
+        self.source = None
+        self._last_run_ts = None
+
+    def add_attempt(self, attempt):
+        ts = attempt['ts']
+        self.attempts += 1
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.last_ts = ts
+        code = attempt.get('code')
+        self.codes[code] += 1
+        if code in SKIP_CODES:
+            return
+        if attempt.get('peak_rss'):
+            self.max_peak_rss = max(self.max_peak_rss or 0, attempt['peak_rss'])
+        if self._last_run_ts is not None:
+            self.intervals.append(ts - self._last_run_ts)
+        self._last_run_ts = ts
+        if attempt.get('end_ts'):
+            self.durations.append(attempt['end_ts'] - ts)
+
+    def load(self):
+        # the tracker only keeps the attempts since the last run, the history has them all
+        history = History(os.path.join(os.path.dirname(self.file), HISTORY_FILENAME))
+        self.source = 'history' if history.get_files() else 'tracker'
+        with open(self.file) as fd:
+            for key, value in TrackerReader(fd):
+                if key == 'attempts':
+                    if self.source == 'tracker':
+                        self.add_attempt(value)
+                elif key == 'settings':
+                    self.settings = value or {}
+        if self.source == 'history':
+            for attempt in history:
+                self.add_attempt(attempt)
+        return self
+
+    def get_report(self):
+        durations = sorted(self.durations)
+        run_delta = self.settings.get('run_delta')
+        interval = get_median(self.intervals)
+        wasted = self.codes.get('not_ready', 0)
+        return {
+            'name': self.name,
+            'file': self.file,
+            'source': self.source,
+            'attempts': self.attempts,
+            'runs': self.attempts - sum(v for k, v in self.codes.items() if k in SKIP_CODES),
+            'completed_runs': len(durations),
+            'first_ts': self.first_ts,
+            'last_ts': self.last_ts,
+            'duration_percentiles': {f'p{p}': get_percentile(durations, p) for p in PERCENTILES},
+            'max_duration': durations[-1] if durations else None,
+            'max_peak_rss': self.max_peak_rss,
+            'codes': dict(self.codes.most_common()),
+            'run_delta': run_delta,
+            'median_run_interval': interval,
+            'run_interval_ratio': interval / run_delta if interval is not None and run_delta else None,
+            'wasted_wakeups': wasted,
+            'wasted_wakeup_ratio': wasted / self.attempts if self.attempts else None,
+        }
+
+
+def list_tracker_files(paths=None):
+    if not paths:
+        return sorted(glob.glob(os.path.join(HOME_DIR, '.*', TRACKER_FILENAME)))
+    return [os.path.join(p, TRACKER_FILENAME) if os.path.isdir(p) else p for p in paths]
+
+
+def get_service_name(file):
+    return os.path.basename(os.path.dirname(os.path.realpath(file))).lstrip('.')
+
+
+def get_reports(paths=None):
+    res = []
+    for file in list_tracker_files(paths):
+        try:
+            res.append(ServiceStats(get_service_name(file), file).load().get_report())
+        except (OSError, ValueError) as exc:
+            print(f'failed to read {file}: {exc}', file=sys.stderr)
+    return res
+
+
+def _format_seconds(value):
+    if value is None:
+        return '-'
+    if value < 120:
+        return f'{value:.1f}s'
+    if value < 7200:
+        return f'{value / 60:.1f}m'
+    return f'{value / 3600:.1f}h'
+
+
+def _format_ratio(value):
+    return '-' if value is None else f'{value:.2f}'
+
+
+def format_table(reports):
+    header = ['service', 'attempts', 'runs'] + [f'p{p}' for p in PERCENTILES] + \
+        ['max', 'interval', 'run_delta', 'ratio', 'wasted', 'skip reasons']
+    rows = [header]
+    for r in reports:
+        skips = ' '.join(f'{k}:{v}' for k, v in r['codes'].items() if k in SKIP_CODES)
+        rows.append([
+            r['name'],
+            str(r['attempts']),
+            str(r['runs']),
+            *[_format_seconds(v) for v in r['duration_percentiles'].values()],
+            _format_seconds(r['max_duration']),
+            _format_seconds(r['median_run_interval']),
+            _format_seconds(r['run_delta']),
+            _format_ratio(r['run_interval_ratio']),
+            _format_ratio(r['wasted_wakeup_ratio']),
+            skips or '-',
+        ])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header) - 1)]
+    return '\n'.join('  '.join([c.ljust(w) for c, w in zip(row, widths)] + [row[-1]]) for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m svcutils.stats',
+                                     description='report service tracker statistics')
+    parser.add_argument('paths', nargs='*',
+                        help=f'work dirs or tracker files (default: ~/.*/{TRACKER_FILENAME})')
+    parser.add_argument('--json', action='store_true', help='json output')
+    args = parser.parse_args(argv)
+    reports = get_reports(args.paths)
+    if args.json:
+        print(json.dumps(reports, indent=4, sort_keys=True))
+    else:
+        print(format_table(reports))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+from datetime import datetime
+from itertools import islice
+import json
+import os
+
+HISTORY_FILENAME = '.svc.history'
+FIELDS = ('ts', 'is_online', 'volume_labels', 'code', 'end_ts')
+DERIVED_FIELDS = {'dt': 'ts', 'end_dt': 'end_ts'}
+KNOWN_FIELDS = set(FIELDS) | set(DERIVED_FIELDS)
+
+_labels = {}
+_encode = json.JSONEncoder(sort_keys=True).encode
+
+
+def intern_labels(labels):
+    # unchanged volume labels share the same frozenset between attempts
+    if labels is None:
+        return None
+    labels = frozenset(labels)
+    return _labels.setdefault(labels, labels)
+
+
+class Attempt:
+    # dict-like tracker attempt, dates are derived from timestamps on demand
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, ts, is_online=None, volume_labels=None, code=None, end_ts=None, **extra):
+        self.ts = ts
+        self.is_online = is_online
+        self.volume_labels = intern_labels(volume_labels)
+        self.code = code
+        self.end_ts = end_ts
+        self.extra = None
+        for key, value in extra.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            return getattr(self, key)
+        if key in DERIVED_FIELDS:
+            ts = getattr(self, DERIVED_FIELDS[key])
+            if ts is None:
+                raise KeyError(key)
+            return datetime.fromtimestamp(ts).isoformat()
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key == 'volume_labels':
+            self.volume_labels = intern_labels(value)
+        elif key in FIELDS:
+            setattr(self, key, value)
+        elif key not in DERIVED_FIELDS:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return key != 'end_ts' or self.end_ts is not None
+
+    def __eq__(self, other):
+        if isinstance(other, Attempt):
+            other = other.to_dict()
+        return isinstance(other, dict) and self.to_dict() == other
+
+    def __repr__(self):
+        return f'Attempt({self.to_dict()})'
+
+    def get(self, key, default=None):
+        try:
+            res = self[key]
+        except KeyError:
+            return default
+        return default if key == 'end_ts' and res is None else res
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def to_dict(self):
+        res = {
+            'ts': self.ts,
+            'dt': datetime.fromtimestamp(self.ts).isoformat(),
+            'is_online': self.is_online,
+            'volume_labels': sorted(self.volume_labels) if self.volume_labels is not None else None,
+            'code': self.code,
+        }
+        if self.end_ts is not None:
+            res['end_ts'] = self.end_ts
+            res['end_dt'] = datetime.fromtimestamp(self.end_ts).isoformat()
+        if self.extra:
+            res.update(self.extra)
+        return res
+
+    @classmethod
+    def from_dict(cls, data):
+        res = cls.__new__(cls)
+        res.ts = data['ts']
+        res.is_online = data.get('is_online')
+        res.volume_labels = intern_labels(data.get('volume_labels'))
+        res.code = data.get('code')
+        res.end_ts = data.get('end_ts')
+        res.extra = {k: v for k, v in data.items() if k not in KNOWN_FIELDS} or None
+        return res
+
+
+def load_tracker_data(data):
+    attempts = [Attempt.from_dict(a) for a in data.get('attempts') or []]
+    last_run = data.get('last_run')
+    if last_run:
+        # the last run is usually one of the attempts
+        last_run = next((a for a in reversed(attempts) if a.ts == last_run['ts']), None) \
+            or Attempt.from_dict(last_run)
+    return {**data, 'attempts': attempts, 'last_run': last_run}
+
+
+def dump_tracker_data(data):
+    return {
+        **data,
+        'attempts': [a.to_dict() for a in data['attempts']],
+        'last_run': data['last_run'].to_dict() if data['last_run'] else None,
+    }
+
+
+def write_tracker_data(data, fd):
+    # one attempt per line, the indenting json encoder is pure python and much slower
+    items = sorted(data.items())
+    fd.write('{\n')
+    for i, (key, value) in enumerate(items):
+        if key == 'attempts' and value:
+            fd.write(f'    {_encode(key)}: [\n        ')
+            fd.writelines(f'{_encode(a.to_dict())},\n        ' for a in islice(value, len(value) - 1))
+            fd.write(f'{_encode(value[-1].to_dict())}\n    ]')
+        else:
+            if isinstance(value, Attempt):
+                value = value.to_dict()
+            fd.write(f'    {_encode(key)}: {_encode(value)}')
+        fd.write(',\n' if i < len(items) - 1 else '\n')
+    fd.write('}\n')
+
+
+class History:
+    # append-only json lines of finished attempts, rotated like the logs,
+    # the tracker only keeps the attempts since the last run
+    def __init__(self, file, max_size=1024000, backup_count=5):
+        self.file = file
+        self.max_size = max_size
+        self.backup_count = backup_count
+
+    def _get_backup_file(self, index):
+        return f'{self.file}.{index}'
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(self._get_backup_file(i)):
+                os.replace(self._get_backup_file(i), self._get_backup_file(i + 1))
+        os.replace(self.file, self._get_backup_file(1))
+
+    def append(self, attempt):
+        line = f'{_encode({k: v for k, v in attempt.to_dict().items() if k not in DERIVED_FIELDS})}\n'
+        try:
+            size = os.path.getsize(self.file)
+        except FileNotFoundError:
+            size = 0
+        if size and size + len(line) > self.max_size and self.backup_count:
+            self._rotate()
+            size = 0
+        with open(self.file, 'a+b') as fd:
+            if size:
+                # do not extend the line of an interrupted append
+                fd.seek(size - 1)
+                if fd.read(1) != b'\n':
+                    line = f'\n{line}'
+            fd.write(line.encode('utf-8'))
+
+    def get_files(self):
+        # oldest first
+        files = [self._get_backup_file(i) for i in range(self.backup_count, 0, -1)] + [self.file]
+        return [f for f in files if os.path.exists(f)]
+
+    def __iter__(self):
+        for file in self.get_files():
+            try:
+                with open(file) as fd:
+                    for line in fd:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            # interrupted append
+                            continue
+            except FileNotFoundError:
+                continue
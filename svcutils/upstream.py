@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from svcutils.inputs import IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE, IN_MOVED_TO, IN_ONLYDIR, Inotify
+
+UPSTREAM_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO | IN_ONLYDIR
+
+logger = logging.getLogger(__name__)
+
+
+class Upstream:
+    # completion ts of an upstream, the mtime of a run file or the end of the last run of a service tracker
+    def __init__(self, file, is_tracker=False):
+        self.file = os.path.abspath(os.path.expanduser(file))
+        self.is_tracker = is_tracker
+        self._cache = (None, 0)
+
+    def __repr__(self):
+        return f'Upstream({self.file!r}, is_tracker={self.is_tracker})'
+
+    def _read_tracker_ts(self):
+        try:
+            with open(self.file) as fd:
+                last_run = json.load(fd).get('last_run')
+        except (FileNotFoundError, ValueError):
+            return 0
+        return (last_run or {}).get('end_ts') or 0
+
+    def get_ts(self):
+        try:
+            st = os.stat(self.file)
+        except FileNotFoundError:
+            return 0
+        if not self.is_tracker:
+            return st.st_mtime
+        # trackers are rewritten on every attempt, parse them only when they change
+        # shared with the watcher thread, the cache is replaced as a whole
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        cache = self._cache
+        if key != cache[0]:
+            cache = self._cache = (key, self._read_tracker_ts())
+        return cache[1]
+
+
+class UpstreamWatcher:
+    # calls callback when an upstream completes, on inotify events or by polling
+    def __init__(self, upstreams, callback, debounce=1, poll_delta=10, use_inotify=True):
+        self.upstreams = upstreams
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_delta = poll_delta
+        self.use_inotify = use_inotify
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _open_inotify(self):
+        if not (self.use_inotify and sys.platform == 'linux'):
+            return None
+        try:
+            inotify = Inotify()
+        except (OSError, AttributeError, TypeError):
+            logger.exception('failed to initialize inotify, polling instead')
+            return None
+        try:
+            for dirname in {os.path.dirname(u.file) for u in self.upstreams}:
+                inotify.add_watch(dirname, UPSTREAM_MASK)
+        except OSError as exc:
+            logger.warning(f'failed to watch upstreams, polling instead: {exc}')
+            inotify.close()
+            return None
+        return inotify
+
+    def _wait(self, inotify, timeout):
+        # returns True if an upstream file was written
+        if inotify is None:
+            self._stop_event.wait(timeout)
+            return False
+        names = {os.path.basename(u.file) for u in self.upstreams}
+        end_ts = time.monotonic() + timeout
+        # short selects so stop() does not wait for the poll delta
+        while not self._stop_event.is_set():
+            remaining = end_ts - time.monotonic()
+            if remaining <= 0:
+                break
+            if names & {name for _, _, name in inotify.read_events(min(remaining, 1))}:
+                return True
+        return False
+
+    def _get_ts(self):
+        return max((u.get_ts() for u in self.upstreams), default=0)
+
+    def _run(self):
+        inotify = self._open_inotify()
+        ts = self._get_ts()
+        try:
+            while not self._stop_event.is_set():
+                if self._wait(inotify, self.poll_delta):
+                    # coalesce bursts of writes
+                    while self._wait(inotify, self.debounce) and not self._stop_event.is_set():
+                        pass
+                if self._stop_event.is_set():
+                    break
+                new_ts = self._get_ts()
+                if new_ts > ts:
+                    logger.info(f'upstream completed at {new_ts}')
+                    try:
+                        self.callback()
+                    except Exception:
+                        logger.exception('upstream callback failed')
+                ts = max(ts, new_ts)
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
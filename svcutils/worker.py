@@ -0,0 +1,189 @@
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+import psutil
+
+EXIT_CODE_FAILED = 1
+EXIT_CODE_OUT_OF_MEMORY = 3
+
+logger = logging.getLogger(__name__)
+
+
+def _set_limits(max_memory=None, max_cpu_time=None, nice=None, ionice=None):
+    if max_memory or max_cpu_time:
+        import resource
+        if max_memory:
+            resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+        if max_cpu_time:
+            # SIGXCPU at the soft limit, SIGKILL at the hard limit
+            resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_time, max_cpu_time + 5))
+    if nice:
+        os.nice(nice)
+    if ionice is not None:
+        psutil.Process().ionice(ionice)
+
+
+def _get_max_rss(who):
+    try:
+        import resource
+    except ImportError:
+        return None
+    res = resource.getrusage(getattr(resource, who)).ru_maxrss
+    return res if sys.platform == 'darwin' else res * 1024
+
+
+def _run(func, args, kwargs, limits, peak_rss):
+    try:
+        _set_limits(**limits)
+        func(*args, **kwargs)
+    except MemoryError:
+        logger.error('worker ran out of memory')
+        sys.exit(EXIT_CODE_OUT_OF_MEMORY)
+    except Exception:
+        logger.exception('worker failed')
+        sys.exit(EXIT_CODE_FAILED)
+    finally:
+        peak_rss.value = _get_max_rss('RUSAGE_SELF') or 0
+
+
+def get_exit_code_name(exit_code):
+    if exit_code == 0:
+        return None
+    if exit_code == EXIT_CODE_OUT_OF_MEMORY:
+        return 'out_of_memory'
+    if hasattr(signal, 'SIGXCPU') and exit_code == -signal.SIGXCPU:
+        return 'cpu_time_exceeded'
+    if exit_code == -getattr(signal, 'SIGKILL', 9):
+        return 'killed'
+    return 'failed'
+
+
+class PeakRssSampler:
+    def __init__(self, pid=None, interval=1):
+        self.pid = pid or os.getpid()
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _sample_once(self):
+        try:
+            self.peak_rss = max(self.peak_rss, psutil.Process(self.pid).memory_info().rss)
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+
+    def _sample(self):
+        while True:
+            self._sample_once()
+            if self._stop_event.wait(self.interval):
+                break
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        return self.peak_rss
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class Worker:
+    def __init__(self, timeout=None, max_memory=None, max_cpu_time=None, nice=None, ionice=None,
+                 start_method=None, kill_delay=5):
+        self.timeout = timeout
+        self.limits = {
+            'max_memory': max_memory,
+            'max_cpu_time': max_cpu_time,
+            'nice': nice,
+            'ionice': ionice,
+        }
+        # fork when available so any target works, spawn and forkserver require a picklable target
+        if start_method is None and 'fork' in multiprocessing.get_all_start_methods():
+            start_method = 'fork'
+        self.context = multiprocessing.get_context(start_method)
+        self.kill_delay = kill_delay
+
+    def _stop(self, proc):
+        try:
+            # a paused worker would not handle SIGTERM
+            psutil.Process(proc.pid).resume()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+        proc.terminate()
+        proc.join(self.kill_delay)
+        if proc.is_alive():
+            logger.warning(f'worker (PID={proc.pid}) did not terminate, killing it')
+            proc.kill()
+            proc.join()
+
+    def _get_peak_rss(self, reported_rss, sampled_rss, children_max_rss):
+        if reported_rss:
+            return reported_rss
+        # killed workers do not report, the children max rss only tells about them when it increased
+        max_rss = _get_max_rss('RUSAGE_CHILDREN')
+        if max_rss and max_rss > (children_max_rss or 0):
+            return max(max_rss, sampled_rss)
+        return sampled_rss
+
+    def _join(self, proc, on_wait=None, wait_delta=1):
+        if not on_wait:
+            proc.join(self.timeout)
+            return
+        end_ts = time.monotonic() + self.timeout if self.timeout else None
+        while True:
+            delta = wait_delta if end_ts is None else min(wait_delta, end_ts - time.monotonic())
+            if delta <= 0:
+                return
+            proc.join(delta)
+            if not proc.is_alive():
+                return
+            on_wait(proc.pid)
+
+    def run(self, func, args=None, kwargs=None, on_wait=None):
+        children_max_rss = _get_max_rss('RUSAGE_CHILDREN')
+        peak_rss = self.context.Value('q', 0, lock=False)
+        proc = self.context.Process(target=_run, args=(func, args or (), kwargs or {}, self.limits, peak_rss))
+        try:
+            proc.start()
+        except Exception as exc:
+            # most likely an unpicklable target with a non-fork start method
+            logger.exception(f'failed to start worker with the {self.context.get_start_method()} start method')
+            return {'code': 'failed', 'error': repr(exc), 'exit_code': None, 'peak_rss': 0}
+        with PeakRssSampler(proc.pid) as sampler:
+            self._join(proc, on_wait=on_wait)
+            if proc.is_alive():
+                logger.error(f'worker (PID={proc.pid}) timed out after {self.timeout} seconds')
+                self._stop(proc)
+                code = 'timeout'
+            else:
+                code = get_exit_code_name(proc.exitcode)
+                if code:
+                    logger.error(f'worker (PID={proc.pid}) exited with code {proc.exitcode}')
+        return {
+            'code': code,
+            'exit_code': proc.exitcode,
+            'peak_rss': self._get_peak_rss(peak_rss.value, sampler.peak_rss, children_max_rss),
+        }
+
+
+def get_worker(options=None):
+    if options is None or options is False:
+        return None
+    if options is True:
+        options = {}
+    return Worker(**options)
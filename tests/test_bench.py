@@ -0,0 +1,22 @@
+import unittest
+
+from svcutils import bench as module
+
+
+class BenchTestCase(unittest.TestCase):
+    def test_1(self):
+        res = module.run_benchmarks(sizes=[100], min_time=.001, repeat=1)
+        self.assertEqual(set(res), {f'{k}[100]' if sized else k for k, (_, sized) in module.BENCHMARKS.items()})
+        for value in res.values():
+            self.assertTrue(value['min'] > 0)
+            self.assertTrue(value['peak_alloc'] >= 0)
+        self.assertTrue(module.format_table(res, baseline=res))
+
+    def test_compare(self):
+        baseline = {'a': {'min': 1., 'peak_alloc': 100}, 'b': {'min': 1., 'peak_alloc': 100}}
+        results = {
+            'a': {'min': 1.1, 'peak_alloc': 100},
+            'b': {'min': 1., 'peak_alloc': 200},
+            'c': {'min': 10., 'peak_alloc': 100},
+        }
+        self.assertEqual(module.compare(results, baseline, threshold=.25), {'b': {'min': 1., 'peak_alloc': 2.}})
@@ -42,6 +42,24 @@ class CrontabTestCase(unittest.TestCase):
     def test_4(self):
         self.assertEqual(self.bs._generate_crontab_schedule(schedule_minutes=24 * 60 + 1), '0 0 * * *')
 
+    def test_spread(self):
+        phase = 5 * 60 + 37
+        self.assertEqual(self.bs._generate_crontab_schedule(schedule_minutes=1, phase=phase), '* * * * *')
+        self.assertEqual(self.bs._generate_crontab_schedule(schedule_minutes=15, phase=phase), '7-59/15 * * * *')
+        self.assertEqual(self.bs._generate_crontab_schedule(schedule_minutes=60, phase=phase), '37 * * * *')
+        self.assertEqual(self.bs._generate_crontab_schedule(schedule_minutes=60 * 2, phase=phase), '37 1-23/2 * * *')
+        self.assertEqual(self.bs._generate_crontab_schedule(schedule_minutes=24 * 60 + 1, phase=phase), '37 5 * * *')
+
+
+class HostPhaseTestCase(unittest.TestCase):
+    def test_1(self):
+        phase = module.get_host_phase('name', 60)
+        self.assertEqual(module.get_host_phase('name', 60), phase)
+        self.assertTrue(0 <= phase < 60)
+        with patch.object(module.socket, 'gethostname', side_effect=[f'host{i}' for i in range(100)]):
+            phases = {module.get_host_phase('name', 60) for i in range(100)}
+        self.assertTrue(len(phases) > 30)
+
 
 class BootstrapperTestCase(unittest.TestCase):
     def setUp(self):
@@ -73,3 +91,82 @@ class BootstrapperTestCase(unittest.TestCase):
             cmd = cmd.split(' ')
             print(cmd)
             self.assertEqual(cmd[1:], ['-m'] + args)
+
+    def test_control_task(self):
+        args = ['module.main', 'arg']
+        with patch.object(self.bs, '_setup_windows_task') as mock__setup_windows_task, \
+             patch.object(self.bs, '_setup_linux_crontab') as mock__setup_linux_crontab:
+            self.bs._setup_task(name='test', args=args, control_command='trigger')
+            mock = mock__setup_windows_task if sys.platform == 'win32' else mock__setup_linux_crontab
+            cmd = mock.call_args_list[0].kwargs['cmd'].split(' ')
+            self.assertEqual(cmd[1:], ['-m', 'svcutils.control', self.bs.work_dir, 'trigger', '--fallback'] + args)
+
+
+class BundleTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+        self.bundle_dir = os.path.join(WORK_DIR, 'bundles')
+        self.wheels_dir = os.path.join(WORK_DIR, 'wheels')
+        os.makedirs(self.wheels_dir)
+        for name in ('pkg1-1.0-py3-none-any.whl', 'pkg2-2.0-py3-none-any.whl'):
+            with open(os.path.join(self.wheels_dir, name), 'wb') as fd:
+                fd.write(os.urandom(1000))
+        self.lock = 'pkg1==1.0\npkg2==2.0\n'
+
+    def _create_bundle(self, file):
+        return module.create_bundle(file, self.wheels_dir, self.lock, install_requires=['pkg1'])
+
+    def test_bundle(self):
+        file = os.path.join(WORK_DIR, 'bundle.tar.gz')
+        manifest = self._create_bundle(file)
+        self.assertEqual(manifest['key'], module.get_bundle_key())
+        dst_dir = os.path.join(WORK_DIR, 'dst')
+        os.makedirs(dst_dir)
+        self.assertEqual(module.extract_bundle(file, dst_dir), manifest)
+        self.assertEqual(sorted(os.listdir(os.path.join(dst_dir, module.BUNDLE_WHEELS_DIRNAME))),
+                         sorted(os.listdir(self.wheels_dir)))
+
+    def test_integrity(self):
+        file = os.path.join(WORK_DIR, 'bundle.tar.gz')
+        self._create_bundle(file)
+        src_dir = os.path.join(WORK_DIR, 'src')
+        os.makedirs(src_dir)
+        module.extract_bundle(file, src_dir)
+        with open(os.path.join(src_dir, module.BUNDLE_WHEELS_DIRNAME, 'pkg1-1.0-py3-none-any.whl'), 'ab') as fd:
+            fd.write(b'x')
+        with module.tarfile.open(file, 'w:gz') as tar:
+            for name in os.listdir(src_dir):
+                tar.add(os.path.join(src_dir, name), arcname=name)
+        dst_dir = os.path.join(WORK_DIR, 'dst')
+        os.makedirs(dst_dir)
+        self.assertRaises(SystemExit, module.extract_bundle, file, dst_dir)
+
+    def test_install(self):
+        bs = get_bs(name=NAME, install_requires=['pkg1'], bundle_dir=self.bundle_dir)
+        os.makedirs(self.bundle_dir)
+        self._create_bundle(bs.bundle_file)
+        with patch.object(module.subprocess, 'check_call') as mock_check_call:
+            bs._install_requires()
+        cmd = mock_check_call.call_args_list[0].args[0]
+        self.assertTrue('--no-index' in cmd)
+        self.assertTrue(cmd[cmd.index('-r') + 1].endswith(module.BUNDLE_LOCK_FILENAME))
+
+        bs.install_requires = ['pkg1', 'pkg3']
+        with patch.object(module.subprocess, 'check_call') as mock_check_call:
+            bs._install_requires()
+        self.assertEqual(mock_check_call.call_args_list[0].args[0], [bs.pip_path, 'install', 'pkg1', 'pkg3'])
+
+    def test_build(self):
+        bs = get_bs(name=NAME, install_requires=['pkg1'], bundle_dir=self.bundle_dir, build_bundle=True)
+
+        def check_call(cmd):
+            if 'wheel' in cmd:
+                module.shutil.copytree(self.wheels_dir, cmd[cmd.index('--wheel-dir') + 1])
+
+        with patch.object(module.subprocess, 'check_call', side_effect=check_call), \
+                patch.object(module.subprocess, 'check_output', return_value=self.lock):
+            bs._install_requires()
+        dst_dir = os.path.join(WORK_DIR, 'dst')
+        os.makedirs(dst_dir)
+        self.assertEqual(module.extract_bundle(bs.bundle_file, dst_dir)['install_requires'], ['pkg1'])
@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import checkpoint as module
+from svcutils import service
+
+CHECKPOINT_FILE = os.path.join(WORK_DIR, module.CHECKPOINT_FILENAME)
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def count_lines(file):
+    with open(file) as fd:
+        return len(fd.readlines())
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_persistence(self):
+        with module.Checkpoint(CHECKPOINT_FILE) as cp:
+            self.assertFalse(cp)
+            cp.save('cursor', 1)
+            cp.save('cursor', 2)
+            cp.save('files', ['a', 'b'])
+            cp.save('tmp', None)
+            cp.delete('tmp')
+        cp = module.Checkpoint(CHECKPOINT_FILE)
+        self.assertEqual(cp.data, {'cursor': 2, 'files': ['a', 'b']})
+        self.assertTrue('cursor' in cp)
+        self.assertEqual(cp.get('invalid', 'default'), 'default')
+
+    def test_compaction(self):
+        with module.Checkpoint(CHECKPOINT_FILE, max_journal_size=10) as cp:
+            for i in range(25):
+                cp.save('cursor', i)
+        self.assertTrue(count_lines(CHECKPOINT_FILE) <= 10)
+        self.assertEqual(module.Checkpoint(CHECKPOINT_FILE).data, {'cursor': 24})
+
+    def test_truncated_line(self):
+        with module.Checkpoint(CHECKPOINT_FILE) as cp:
+            cp.save('cursor', 1)
+        with open(CHECKPOINT_FILE, 'a') as fd:
+            fd.write('{"k": "cursor", "v"')
+        with module.Checkpoint(CHECKPOINT_FILE) as cp:
+            self.assertEqual(cp.data, {'cursor': 1})
+            cp.save('cursor', 2)
+        self.assertEqual(module.Checkpoint(CHECKPOINT_FILE).data, {'cursor': 2})
+
+    def test_clear(self):
+        cp = module.Checkpoint(CHECKPOINT_FILE)
+        cp.save('cursor', 1)
+        cp.clear()
+        self.assertFalse(os.path.exists(CHECKPOINT_FILE))
+        self.assertEqual(module.Checkpoint(CHECKPOINT_FILE).data, {})
+
+
+class ServiceCheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+        self.now = datetime.now().replace(minute=0, second=0)
+        self.cursors = []
+        self.interrupt_at = None
+
+    def _target(self, items, checkpoint):
+        start = checkpoint.get('cursor', 0)
+        self.cursors.append(start)
+        for i in range(start, items):
+            if i == self.interrupt_at:
+                raise KeyboardInterrupt()
+            checkpoint.save('cursor', i + 1)
+
+    def _run_once(self, now):
+        se = service.Service(target=self._target, args=(10,), work_dir=WORK_DIR, run_delta=3600,
+                             checkpoint=True)
+        with patch('svcutils.service.time.time', return_value=now.timestamp()), \
+                patch('svcutils.service.is_fullscreen', return_value=False):
+            try:
+                se.run_once()
+            except KeyboardInterrupt:
+                pass
+        return se._load_tracker_data()
+
+    def test_resume(self):
+        self.interrupt_at = 4
+        data = self._run_once(self.now)
+        self.assertFalse('end_ts' in data['last_run'])
+        self.assertTrue(os.path.exists(os.path.join(WORK_DIR, module.CHECKPOINT_FILENAME)))
+
+        # resumes before run_delta
+        self.interrupt_at = None
+        data = self._run_once(self.now + timedelta(minutes=2))
+        self.assertEqual(self.cursors, [0, 4])
+        self.assertTrue(data['last_run']['end_ts'])
+        self.assertFalse(os.path.exists(os.path.join(WORK_DIR, module.CHECKPOINT_FILENAME)))
+
+        data = self._run_once(self.now + timedelta(minutes=4))
+        self.assertEqual(data['attempts'][-1]['code'], 'not_ready')
+        data = self._run_once(self.now + timedelta(minutes=64))
+        self.assertEqual(self.cursors, [0, 4, 0])
@@ -0,0 +1,139 @@
+import os
+import shutil
+import socket
+import threading
+import time
+from multiprocessing import Process
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import control as module
+from svcutils import service
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def wait_for(func, timeout=10):
+    end_ts = time.monotonic() + timeout
+    while time.monotonic() < end_ts:
+        if func():
+            return True
+        time.sleep(.05)
+    return False
+
+
+def append_run(file):
+    with open(file, 'a') as fd:
+        fd.write('run\n')
+
+
+def get_runs(file):
+    if not os.path.exists(file):
+        return 0
+    with open(file) as fd:
+        return len(fd.read().splitlines())
+
+
+def run_daemon(work_dir, file):
+    with patch.object(service, 'is_fullscreen', return_value=False):
+        service.Service(target=append_run, args=(file,), work_dir=work_dir, run_delta=3600,
+                        control_socket=True).run()
+
+
+class ControlServerTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_1(self):
+        self.assertEqual(module.send_command(WORK_DIR, 'status'), None)
+        commands = []
+
+        def handler(command):
+            commands.append(command)
+            return {'command': command}
+
+        server = module.ControlServer(WORK_DIR, handler).start()
+        try:
+            self.assertEqual(module.send_command(WORK_DIR, 'status'), {'ok': True, 'result': {'command': 'status'}})
+            self.assertFalse(module.send_command(WORK_DIR, 'invalid')['ok'])
+            self.assertEqual(commands, ['status'])
+        finally:
+            server.stop()
+        self.assertFalse(os.path.exists(module.get_control_file(WORK_DIR)))
+        self.assertEqual(module.send_command(WORK_DIR, 'status'), None)
+
+    def test_stale_socket(self):
+        with open(module.get_control_file(WORK_DIR), 'w'):
+            pass
+        self.assertEqual(module.send_command(WORK_DIR, 'status'), None)
+        server = module.ControlServer(WORK_DIR, lambda command: command).start()
+        try:
+            self.assertTrue(module.send_command(WORK_DIR, 'status')['ok'])
+        finally:
+            server.stop()
+
+    def test_no_response(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(module.get_control_file(WORK_DIR))
+            server.listen(1)
+
+            def close():
+                conn, _ = server.accept()
+                with conn:
+                    module._read_line(conn)
+
+            thread = threading.Thread(target=close)
+            thread.start()
+            try:
+                # closed without a response
+                with patch.object(module.json, 'loads', wraps=module.json.loads) as mock_loads:
+                    self.assertEqual(module.send_command(WORK_DIR, 'status', timeout=.2), None)
+                mock_loads.assert_called_once_with('')
+            finally:
+                thread.join()
+            # never accepted
+            self.assertEqual(module.send_command(WORK_DIR, 'status', timeout=.2), None)
+
+
+class DaemonTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        self.work_dir = os.path.join(WORK_DIR, '.svc')
+        os.makedirs(self.work_dir)
+        self.file = os.path.join(WORK_DIR, 'runs.txt')
+
+    def test_1(self):
+        proc = Process(target=run_daemon, args=(self.work_dir, self.file))
+        proc.start()
+        try:
+            self.assertTrue(wait_for(lambda: get_runs(self.file) == 1))
+            self.assertTrue(wait_for(lambda: module.send_command(self.work_dir, 'status')))
+            res = module.send_command(self.work_dir, 'status')['result']
+            self.assertEqual((res['name'], res['pid']), ('svc', proc.pid))
+            self.assertEqual(res['last_run']['code'], 'ready')
+
+            # not due yet
+            self.assertEqual(module.send_command(self.work_dir, 'trigger'), {'ok': True, 'result': 'trigger'})
+            self.assertTrue(wait_for(lambda: module.send_command(self.work_dir, 'status')['result']
+                                     ['last_attempt']['code'] == 'not_ready'))
+            self.assertEqual(get_runs(self.file), 1)
+
+            start_ts = time.monotonic()
+            # the daemon runs its own target
+            service.Service(target=lambda: None, work_dir=self.work_dir, control_socket=True).run_once(force=True)
+            self.assertTrue(wait_for(lambda: get_runs(self.file) == 2))
+            self.assertTrue(time.monotonic() - start_ts < 5)
+        finally:
+            proc.terminate()
+            proc.join()
+
+    def test_instances(self):
+        self.assertRaises(ValueError, service.Service, target=lambda: None, work_dir=self.work_dir,
+                          control_socket=True, instances=2)
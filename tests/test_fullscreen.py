@@ -0,0 +1,118 @@
+import os
+import shutil
+import subprocess
+import time
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import fullscreen as module
+from svcutils import service
+from svcutils.tracker import Attempt
+
+XVFB_DISPLAY = ':97'
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def wait_for(func, timeout=5):
+    end_ts = time.monotonic() + timeout
+    while time.monotonic() < end_ts:
+        if func():
+            return True
+        time.sleep(.05)
+    return False
+
+
+class DisconnectedTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_1(self):
+        monitor = module.FullscreenMonitor(display_name=':12345', reconnect_delta=.1).start()
+        time.sleep(.3)
+        self.assertFalse(monitor.is_connected)
+        monitor.stop()
+
+        se = service.Service(target=lambda: None, work_dir=WORK_DIR)
+        se.fullscreen_monitor = monitor
+        with patch.object(service, 'is_fullscreen', return_value=True):
+            self.assertTrue(se._is_fullscreen())
+        monitor.is_connected = True
+        with patch.object(service, 'is_fullscreen', return_value=True):
+            self.assertFalse(se._is_fullscreen())
+
+    def test_wake(self):
+        se = service.Service(target=lambda: None, work_dir=WORK_DIR)
+        se.tracker_data['attempts'] = [Attempt(ts=time.time(), code='fullscreen')]
+        se._on_fullscreen_change(True)
+        self.assertEqual(se._pop_wake_reasons(), set())
+        se._on_fullscreen_change(False)
+        self.assertEqual(se._pop_wake_reasons(), {'fullscreen_end'})
+
+
+@unittest.skipUnless(shutil.which('Xvfb'), 'requires Xvfb')
+class XvfbTestCase(unittest.TestCase):
+    def setUp(self):
+        from Xlib import display
+        self.xvfb = subprocess.Popen(['Xvfb', XVFB_DISPLAY, '-nolisten', 'tcp'],
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.assertTrue(wait_for(lambda: self._connect(display)))
+        self.root = self.display.screen().root
+        self.states = []
+
+    def _connect(self, display):
+        try:
+            self.display = display.Display(XVFB_DISPLAY)
+            return True
+        except Exception:
+            return False
+
+    def tearDown(self):
+        self.display.close()
+        self.xvfb.terminate()
+        self.xvfb.wait()
+
+    def _set_active_window(self, window):
+        from Xlib import Xatom
+        self.root.change_property(self.display.intern_atom('_NET_ACTIVE_WINDOW'), Xatom.WINDOW, 32,
+                                  [window.id if window else 0])
+        self.display.flush()
+
+    def _set_fullscreen(self, window, fullscreen):
+        from Xlib import Xatom
+        atoms = [self.display.intern_atom('_NET_WM_STATE_FULLSCREEN')] if fullscreen else []
+        window.change_property(self.display.intern_atom('_NET_WM_STATE'), Xatom.ATOM, 32, atoms)
+        self.display.flush()
+
+    def test_1(self):
+        window1 = self.root.create_window(0, 0, 100, 100, 0, self.display.screen().root_depth)
+        window2 = self.root.create_window(0, 0, 100, 100, 0, self.display.screen().root_depth)
+        self._set_active_window(window1)
+        monitor = module.FullscreenMonitor(callback=self.states.append, display_name=XVFB_DISPLAY).start()
+        try:
+            self.assertTrue(wait_for(lambda: monitor.is_connected))
+            self.assertFalse(monitor.is_fullscreen)
+
+            self._set_fullscreen(window1, True)
+            self.assertTrue(wait_for(lambda: monitor.is_fullscreen))
+
+            self._set_active_window(window2)
+            self.assertTrue(wait_for(lambda: not monitor.is_fullscreen))
+
+            self._set_active_window(window1)
+            self.assertTrue(wait_for(lambda: monitor.is_fullscreen))
+
+            window1.destroy()
+            self.display.flush()
+            self._set_active_window(window2)
+            self.assertTrue(wait_for(lambda: not monitor.is_fullscreen))
+            self.assertEqual(self.states, [True, False, True, False])
+        finally:
+            monitor.stop()
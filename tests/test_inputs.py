@@ -0,0 +1,219 @@
+import json
+import os
+import shutil
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import inputs as module
+from svcutils import service
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def write_file(file, data):
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, 'w') as fd:
+        fd.write(data)
+
+
+def wait_for_events(timeout=.5):
+    time.sleep(timeout)
+
+
+class InputIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        self.src_dir = os.path.join(WORK_DIR, 'src')
+        self.file = os.path.join(WORK_DIR, module.INPUTS_FILENAME)
+        write_file(os.path.join(self.src_dir, 'a.txt'), 'a')
+        write_file(os.path.join(self.src_dir, 'sub', 'b.txt'), 'b')
+        write_file(os.path.join(self.src_dir, 'sub', 'deep', 'c.txt'), 'c')
+        self.single_file = os.path.join(WORK_DIR, 'single.txt')
+        write_file(self.single_file, 'single')
+
+    def _get_changes(self, index):
+        # fingerprints after each kind of change
+        res = [index.get_fingerprint()]
+        res.append(index.get_fingerprint())
+        write_file(os.path.join(self.src_dir, 'sub', 'deep', 'c.txt'), 'cc')
+        wait_for_events()
+        res.append(index.get_fingerprint())
+        write_file(os.path.join(self.src_dir, 'sub', 'new', 'd.txt'), 'd')
+        wait_for_events()
+        res.append(index.get_fingerprint())
+        os.rename(os.path.join(self.src_dir, 'a.txt'), os.path.join(self.src_dir, 'e.txt'))
+        wait_for_events()
+        res.append(index.get_fingerprint())
+        shutil.rmtree(os.path.join(self.src_dir, 'sub'))
+        wait_for_events()
+        res.append(index.get_fingerprint())
+        write_file(self.single_file, 'changed')
+        res.append(index.get_fingerprint())
+        return res
+
+    def _assert_changes(self, res):
+        self.assertEqual(res[0], res[1])
+        self.assertEqual(len(set(res[1:])), len(res) - 1)
+
+    def test_stat_walk(self):
+        index = module.InputIndex([self.src_dir, self.single_file], self.file, use_inotify=False)
+        self._assert_changes(self._get_changes(index))
+        self.assertIsNone(index.inotify)
+
+    @unittest.skipIf(sys.platform != 'linux', 'inotify is linux only')
+    def test_inotify(self):
+        index = module.InputIndex([self.src_dir, self.single_file], self.file).start()
+        try:
+            self.assertTrue(index.inotify)
+            with patch.object(index, '_scan', wraps=index._scan) as mock_scan:
+                fingerprint = index.get_fingerprint()
+                self.assertEqual(index.get_fingerprint(), fingerprint)
+            # no walk without events
+            mock_scan.assert_not_called()
+            self._assert_changes(self._get_changes(index))
+            # removed subdirs are not watched anymore
+            self.assertEqual(set(index.watched), set(index.entries))
+            self.assertEqual({v: k for k, v in index.watched.items()}, index.watches)
+            # the incremental index matches a full walk
+            expected = module.InputIndex([self.src_dir, self.single_file], self.file,
+                                         use_inotify=False).get_fingerprint()
+            self.assertEqual(index.get_fingerprint(), expected)
+        finally:
+            index.stop()
+        self.assertIsNone(index.inotify)
+
+    @unittest.skipIf(sys.platform != 'linux', 'inotify is linux only')
+    def test_inotify_rescans_changed_dirs_only(self):
+        index = module.InputIndex([self.src_dir], self.file).start()
+        try:
+            index.get_fingerprint()
+            write_file(os.path.join(self.src_dir, 'sub', 'b.txt'), 'bb')
+            wait_for_events()
+            with patch.object(index, '_scan', wraps=index._scan) as mock_scan:
+                index.get_fingerprint()
+            self.assertEqual([c.args[0] for c in mock_scan.call_args_list],
+                             [os.path.join(self.src_dir, 'sub')])
+        finally:
+            index.stop()
+
+    def test_missing_path(self):
+        missing = os.path.join(WORK_DIR, 'missing')
+        index = module.InputIndex([missing], self.file, use_inotify=False)
+        fingerprint = index.get_fingerprint()
+        write_file(os.path.join(missing, 'a.txt'), 'a')
+        self.assertNotEqual(index.get_fingerprint(), fingerprint)
+
+    def test_unreadable_dir(self):
+        unreadable = os.path.join(self.src_dir, 'sub')
+        scandir = os.scandir
+
+        def mock_scandir(path):
+            if path == unreadable:
+                raise PermissionError(13, 'denied', path)
+            return scandir(path)
+
+        index = module.InputIndex([self.src_dir], self.file, use_inotify=False)
+        with patch.object(module.os, 'scandir', side_effect=mock_scandir):
+            fingerprint = index.get_fingerprint()
+            self.assertEqual(index.get_fingerprint(), fingerprint)
+        self.assertEqual(list(index.entries[unreadable]), [module.ERROR_ENTRY])
+        # the fingerprint changes once readable
+        self.assertNotEqual(index.get_fingerprint(), fingerprint)
+
+    def test_persistence(self):
+        index = module.InputIndex([self.src_dir], self.file, use_inotify=False)
+        fingerprint = index.get_fingerprint()
+        index.set_run_fingerprint(fingerprint)
+        self.assertEqual(module.InputIndex([self.src_dir], self.file).run_fingerprint, fingerprint)
+        with open(self.file) as fd:
+            self.assertEqual(set(json.load(fd)), {'paths', 'run_fingerprint'})
+        # other watched paths do not match
+        self.assertIsNone(module.InputIndex([self.src_dir, self.single_file], self.file).run_fingerprint)
+
+
+class ServiceInputsTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        self.src_dir = os.path.join(WORK_DIR, 'src')
+        self.work_dir = os.path.join(WORK_DIR, 'work')
+        os.makedirs(self.work_dir)
+        write_file(os.path.join(self.src_dir, 'a.txt'), 'a')
+        self.runs = []
+
+    def _get_service(self, **kwargs):
+        return service.Service(target=lambda: self.runs.append(1), work_dir=self.work_dir, run_delta=60,
+                               watch_paths=[self.src_dir], **kwargs)
+
+    def test_inputs_unchanged(self):
+        now = [1000000]
+        svc = self._get_service(clock=lambda: now[0])
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            svc.run_once()
+            self.assertEqual(len(self.runs), 1)
+            now[0] += 61
+            svc.run_once()
+            self.assertEqual(svc.tracker_data['attempts'][-1].code, 'inputs_unchanged')
+            self.assertEqual(len(self.runs), 1)
+            # the skip counts as a run for scheduling
+            now[0] += 30
+            svc.run_once()
+            self.assertEqual(svc.tracker_data['attempts'][-1].code, 'not_ready')
+            write_file(os.path.join(self.src_dir, 'b.txt'), 'b')
+            now[0] += 31
+            svc = self._get_service(clock=lambda: now[0])
+            svc.run_once()
+            self.assertEqual(svc.tracker_data['attempts'][-1].code, 'ready')
+            self.assertEqual(len(self.runs), 2)
+            now[0] += 61
+            svc.run_once(force=True)
+        self.assertEqual(len(self.runs), 3)
+
+    def test_failed_run(self):
+        now = [1000000]
+
+        def target():
+            self.runs.append(1)
+            raise Exception('failed')
+
+        svc = service.Service(target=target, work_dir=self.work_dir, run_delta=60, watch_paths=[self.src_dir],
+                              clock=lambda: now[0], retry_policy=service.RetryPolicy(base_delta=10, jitter=0))
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            svc.run_once()
+            now[0] += 11
+            svc.run_once()
+        # a failed run does not record the inputs
+        self.assertEqual(len(self.runs), 2)
+        self.assertIsNone(svc.input_index.run_fingerprint)
+
+    def test_unreadable_dir(self):
+        scandir = os.scandir
+
+        def mock_scandir(path):
+            if path == self.src_dir:
+                raise PermissionError(13, 'denied', path)
+            return scandir(path)
+
+        svc = self._get_service()
+        with patch.object(service, 'is_fullscreen', return_value=False), \
+                patch.object(os, 'scandir', side_effect=mock_scandir), \
+                patch.object(service.logger, 'exception') as mock_exception:
+            svc.run_once()
+        mock_exception.assert_not_called()
+        self.assertEqual(svc.tracker_data['attempts'][-1].code, 'ready')
+        self.assertEqual(len(self.runs), 1)
+
+    def test_cheap_checks_first(self):
+        svc = self._get_service()
+        with patch.object(service, 'is_fullscreen', return_value=True), \
+                patch.object(svc.input_index, 'get_fingerprint') as mock_get_fingerprint:
+            svc.run_once()
+        self.assertEqual(svc.tracker_data['attempts'][-1].code, 'fullscreen')
+        mock_get_fingerprint.assert_not_called()
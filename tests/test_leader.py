@@ -0,0 +1,164 @@
+import multiprocessing
+import os
+import shutil
+import time
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import leader as module
+from svcutils import service
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def compete(path, index, holders, max_holders, leaders, lock, duration=2):
+    # default owner, the processes share the hostname
+    lease = module.get_lease({'path': path, 'ttl': .5})
+    end_ts = time.monotonic() + duration
+    i = 0
+    while time.monotonic() < end_ts:
+        i += 1
+        if lease.acquire():
+            with lock:
+                holders.value += 1
+                max_holders.value = max(max_holders.value, holders.value)
+                leaders[index] = 1
+            time.sleep(.02)
+            with lock:
+                holders.value -= 1
+            if i % 5 == 0:
+                lease.release()
+        time.sleep(.01)
+
+
+class BaseLeaseTestCase:
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def _get_lease(self, owner, **kwargs):
+        return module.get_lease({'path': self.path, 'owner': owner, **kwargs})
+
+    def test_1(self):
+        lease1 = self._get_lease('host1', ttl=.5)
+        lease2 = self._get_lease('host2', ttl=.5)
+        self.assertTrue(lease1.acquire())
+        self.assertEqual(lease1.token, 1)
+        self.assertTrue(lease1.is_held)
+        self.assertFalse(lease2.acquire())
+        self.assertTrue(lease1.renew())
+        self.assertTrue(lease1.acquire())
+        self.assertEqual(lease1.token, 1)
+
+        time.sleep(.6)
+        self.assertFalse(lease1.is_held)
+        self.assertTrue(lease2.acquire())
+        self.assertEqual(lease2.token, 2)
+        self.assertFalse(lease1.renew())
+        self.assertEqual(lease1.token, None)
+
+        lease2.release()
+        self.assertFalse(lease2.is_held)
+        self.assertTrue(lease1.acquire())
+        self.assertEqual(lease1.token, 3)
+
+    def test_heartbeat(self):
+        lease1 = self._get_lease('host1', ttl=.5, renew_delta=.1).start()
+        lease2 = self._get_lease('host2', ttl=.5)
+        try:
+            self.assertTrue(lease1.acquire())
+            time.sleep(1)
+            self.assertFalse(lease2.acquire())
+        finally:
+            lease1.stop()
+        time.sleep(.6)
+        self.assertTrue(lease2.acquire())
+
+    def test_processes(self):
+        ctx = multiprocessing.get_context()
+        holders = ctx.Value('i', 0)
+        max_holders = ctx.Value('i', 0)
+        leaders = ctx.Array('i', 4)
+        lock = ctx.Lock()
+        procs = [ctx.Process(target=compete, args=(self.path, i, holders, max_holders, leaders, lock))
+                 for i in range(4)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        self.assertEqual(max_holders.value, 1)
+        self.assertTrue(sum(leaders) > 1)
+
+    def test_service(self):
+        services = [service.Service(target=lambda: None, work_dir=os.path.join(WORK_DIR, f'.svc{i}'),
+                                    lease={'path': self.path, 'name': 'shared', 'owner': f'host{i}'})
+                    for i in range(2)]
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            for se in services:
+                os.makedirs(se.work_dir)
+                se.run_once()
+        self.assertEqual(services[0].tracker_data['attempts'][-1].code, 'ready')
+        self.assertEqual(services[1].tracker_data['attempts'][-1].code, 'not_leader')
+        self.assertEqual(services[1].tracker_data['last_run'], None)
+        self.assertEqual(services[0].tracker_data['attempts'][-1]['lease_token'], 1)
+
+    def test_service_forced(self):
+        other = self._get_lease('other', name='shared', ttl=60)
+        self.assertTrue(other.acquire())
+        se = service.Service(target=lambda: None, work_dir=WORK_DIR, lease={'path': self.path, 'name': 'shared'})
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            se.run_once(force=True)
+        self.assertEqual(se.tracker_data['attempts'][-1].code, 'not_leader')
+        self.assertEqual(se.tracker_data['last_run'], None)
+
+    def test_service_lease_error(self):
+        se = service.Service(target=lambda: None, work_dir=WORK_DIR, lease=self.path)
+        with patch.object(service, 'is_fullscreen', return_value=False), \
+                patch.object(se.lease, '_transaction', side_effect=OSError(5, 'io error')), \
+                patch.object(service.logger, 'exception') as mock_exception:
+            se.run_once()
+        self.assertEqual(se.tracker_data['attempts'][-1].code, 'not_leader')
+        self.assertEqual([c.args[0] for c in mock_exception.call_args_list], [f'failed to acquire lease {se.name}'])
+
+    def test_service_defaults(self):
+        # unrelated services sharing the lease path do not compete
+        tokens = []
+        services = [service.Service(target=lambda lease_token: tokens.append(lease_token),
+                                    work_dir=os.path.join(WORK_DIR, f'.svc{i}'), lease=self.path,
+                                    pass_lease_token=True)
+                    for i in range(2)]
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            for se in services:
+                os.makedirs(se.work_dir)
+                se.run_once()
+        self.assertEqual([s.tracker_data['attempts'][-1].code for s in services], ['ready', 'ready'])
+        self.assertEqual(tokens, [1, 1])
+        self.assertEqual({s.lease.name for s in services}, {'svc0', 'svc1'})
+        self.assertRaises(ValueError, service.Service, target=lambda: None, work_dir=WORK_DIR,
+                          lease=self.path, instances=2)
+
+    def test_default_owner(self):
+        # local processes or objects on the same host are distinct owners
+        lease1 = module.get_lease({'path': self.path, 'ttl': 60})
+        lease2 = module.get_lease({'path': self.path, 'ttl': 60})
+        self.assertNotEqual(lease1.owner, lease2.owner)
+        self.assertTrue(lease1.acquire())
+        self.assertFalse(lease2.acquire())
+
+
+class DirectoryLeaseTestCase(BaseLeaseTestCase, unittest.TestCase):
+    @property
+    def path(self):
+        return WORK_DIR
+
+
+class SqliteLeaseTestCase(BaseLeaseTestCase, unittest.TestCase):
+    @property
+    def path(self):
+        return os.path.join(WORK_DIR, 'leases.db')
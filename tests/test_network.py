@@ -0,0 +1,149 @@
+import errno
+import socket
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+from svcutils import network as module
+
+
+def get_closed_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ListeningSocketTestCase(unittest.TestCase):
+    def setUp(self):
+        module.clear_online_cache()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(16)
+        self.port = self.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+
+
+class ProbeTestCase(ListeningSocketTestCase):
+    def test_success(self):
+        self.assertTrue(module.probe_targets([('127.0.0.1', self.port)]))
+
+    def test_race(self):
+        start_ts = time.monotonic()
+        targets = [('127.0.0.1', get_closed_port()), ('127.0.0.1', get_closed_port()), ('127.0.0.1', self.port)]
+        self.assertTrue(module.probe_targets(targets, stagger=1))
+        # failed targets do not wait for the stagger delay
+        self.assertTrue(time.monotonic() - start_ts < .5)
+
+    def test_failure(self):
+        self.assertFalse(module.probe_targets([('127.0.0.1', get_closed_port()), ('::1', get_closed_port())]))
+
+    def test_ipv6(self):
+        try:
+            server = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+            server.bind(('::1', 0))
+        except OSError:
+            self.skipTest('ipv6 not available')
+        with server:
+            server.listen(1)
+            self.assertTrue(module.probe_targets([('127.0.0.1', get_closed_port()),
+                                                  ('::1', server.getsockname()[1])]))
+
+    def test_ipv6_unsupported(self):
+        socket_class = socket.socket
+
+        def mock_socket(family=socket.AF_INET, *args, **kwargs):
+            if family == socket.AF_INET6:
+                raise OSError(97, 'address family not supported by protocol')
+            return socket_class(family, *args, **kwargs)
+
+        with patch.object(module.socket, 'socket', side_effect=mock_socket):
+            self.assertFalse(module.probe_targets([('::1', self.port)]))
+            self.assertTrue(module.probe_targets([('::1', self.port), ('127.0.0.1', self.port)], stagger=0))
+
+
+class IsOnlineTestCase(ListeningSocketTestCase):
+    def test_cache(self):
+        targets = [('127.0.0.1', self.port)]
+        self.assertTrue(module.is_online(targets, check_route=False))
+        with patch.object(module, 'probe_targets') as mock_probe_targets:
+            self.assertTrue(module.is_online(targets, check_route=False))
+            self.assertFalse(mock_probe_targets.called)
+            module.is_online(targets, check_route=False, ttl=0)
+            self.assertTrue(mock_probe_targets.called)
+
+    def test_no_default_route(self):
+        with patch.object(module, 'has_default_route', return_value=False), \
+                patch.object(module, 'probe_targets') as mock_probe_targets:
+            self.assertFalse(module.is_online([('192.0.2.1', 53)]))
+            self.assertFalse(mock_probe_targets.called)
+
+    def test_legacy_host_port(self):
+        self.assertTrue(module.is_online('127.0.0.1', self.port))
+        self.assertTrue(module.is_online(host='127.0.0.1', port=self.port, timeout=1))
+        closed_port = get_closed_port()
+        self.assertFalse(module.is_online('127.0.0.1', closed_port, 1))
+        with patch.object(module, 'has_default_route', return_value=False):
+            self.assertTrue(module.is_online('127.0.0.1', self.port, ttl=0))
+
+    def test_unknown_default_route(self):
+        with patch.object(module, 'has_default_route', return_value=None):
+            self.assertTrue(module.is_online([('127.0.0.1', self.port)]))
+
+
+class DefaultRouteTestCase(unittest.TestCase):
+    def test_1(self):
+        self.assertTrue(module.has_default_route() in {True, False, None})
+
+
+class NetworkWatcherTestCase(unittest.TestCase):
+    def _watch(self, states, debounce=.05):
+        self.calls = 0
+
+        def callback():
+            self.calls += 1
+
+        states = iter(states)
+        with patch.object(module, 'has_default_route', side_effect=lambda: next(states, True)):
+            watcher = module.NetworkWatcher(callback, debounce=debounce, poll_delta=.05, use_netlink=False).start()
+            time.sleep(1)
+            watcher.stop()
+        return self.calls
+
+    def test_network_up(self):
+        self.assertEqual(self._watch([False, False, True]), 1)
+
+    def test_always_up(self):
+        self.assertEqual(self._watch([True]), 0)
+
+    def test_flapping(self):
+        # up, then down again after the debounce delay
+        self.assertEqual(self._watch([False, True, False, True, False, False, True, True]), 1)
+
+    def test_netlink(self):
+        watcher = module.NetworkWatcher(lambda: None)
+        sock = watcher._open_netlink()
+        if sock is None:
+            self.skipTest('netlink not available')
+        with sock:
+            self.assertFalse(watcher._wait(sock, .01))
+
+    def test_netlink_overrun(self):
+        watcher = module.NetworkWatcher(lambda: None)
+        sock = Mock(recv=Mock(side_effect=[b'', OSError(errno.ENOBUFS, 'no buffer space available')]))
+        with patch.object(module.select, 'select', return_value=([sock], [], [])):
+            self.assertTrue(watcher._wait(sock, .01))
+
+    def test_netlink_reopen(self):
+        socks = [Mock(recv=Mock(side_effect=OSError(errno.EBADF, 'bad file descriptor'))), None]
+        with patch.object(module.select, 'select', return_value=([socks[0]], [], [])), \
+                patch.object(module, 'has_default_route', return_value=True), \
+                patch.object(module.NetworkWatcher, '_open_netlink', side_effect=socks) as mock_open:
+            watcher = module.NetworkWatcher(lambda: None, poll_delta=.05).start()
+            time.sleep(1.5)
+            self.assertTrue(watcher._thread.is_alive())
+            watcher.stop()
+        # polling once the netlink socket cannot be reopened
+        self.assertEqual(mock_open.call_count, 2)
+        socks[0].close.assert_called_once_with()
@@ -0,0 +1,101 @@
+import os
+import shutil
+import time
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import profiling as module
+from svcutils import service
+
+PROFILE_DIR = os.path.join(WORK_DIR, module.PROFILE_DIRNAME)
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def list_files(ext):
+    return sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(ext))
+
+
+def busy(duration=.1):
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        sum(range(1000))
+
+
+class ParseOptionsTestCase(unittest.TestCase):
+    def test_1(self):
+        self.assertEqual(module.parse_options('0'), None)
+        self.assertEqual(module.parse_options('1'), {})
+        self.assertEqual(module.parse_options('sampling,every=10,min_duration=30,trace_memory=1'),
+                         {'mode': 'sampling', 'every': 10, 'min_duration': 30., 'trace_memory': True})
+
+    def test_env_override(self):
+        with patch.dict(os.environ, {module.PROFILE_ENV_VAR: 'sampling,every=2'}):
+            profiler = module.get_profiler(PROFILE_DIR, {'mode': 'cprofile'})
+        self.assertEqual(profiler.mode, 'sampling')
+        self.assertEqual(profiler.every, 2)
+        with patch.dict(os.environ, {module.PROFILE_ENV_VAR: 'off'}):
+            self.assertEqual(module.get_profiler(PROFILE_DIR, True), None)
+        self.assertEqual(module.get_profiler(PROFILE_DIR, None), None)
+
+
+class ProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_cprofile(self):
+        profiler = module.Profiler(PROFILE_DIR, mode='cprofile', trace_memory=True)
+        with profiler.profile():
+            busy()
+        self.assertEqual(len(list_files('.prof')), 1)
+        self.assertEqual(len(list_files('.mem')), 1)
+
+    def test_sampling(self):
+        profiler = module.Profiler(PROFILE_DIR, mode='sampling', interval=.005)
+        with profiler.profile():
+            busy(.2)
+        files = list_files('.stacks')
+        self.assertEqual(len(files), 1)
+        with open(os.path.join(PROFILE_DIR, files[0])) as fd:
+            self.assertTrue('busy' in fd.read())
+
+    def test_every(self):
+        profiler = module.Profiler(PROFILE_DIR, every=3)
+        for i in range(7):
+            with profiler.profile():
+                pass
+        self.assertEqual(len(list_files('.prof')), 3)
+
+    def test_min_duration(self):
+        profiler = module.Profiler(PROFILE_DIR, mode='sampling', min_duration=.1)
+        with profiler.profile():
+            pass
+        self.assertEqual(list_files('.stacks'), [])
+        with profiler.profile():
+            busy(.15)
+        self.assertEqual(len(list_files('.stacks')), 1)
+
+    def test_rotation(self):
+        profiler = module.Profiler(PROFILE_DIR, max_files=2)
+        for i in range(4):
+            with profiler.profile():
+                pass
+        self.assertEqual(len(list_files('.prof')), 2)
+
+
+class ServiceProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_1(self):
+        se = service.Service(target=busy, work_dir=WORK_DIR, profile={'mode': 'cprofile'})
+        se.run_once()
+        self.assertEqual(len(list_files('.prof')), 1)
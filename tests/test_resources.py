@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import resources as module
+from svcutils import service
+
+POOL_FILE = os.path.join(WORK_DIR, module.POOL_FILENAME)
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+class ResourcePoolTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+        self.pool = module.ResourcePool(capacity=4, file=POOL_FILE, starvation_delta=600)
+
+    def test_capacity(self):
+        self.assertTrue(self.pool.acquire('backup', 3))
+        self.assertFalse(self.pool.acquire('sync', 3))
+        self.assertTrue(self.pool.acquire('index', 1))
+        self.assertEqual(self.pool.get_usage(), 4)
+        self.pool.release('backup')
+        self.assertTrue(self.pool.acquire('sync', 3))
+        self.assertEqual(self.pool.get_usage(), 4)
+
+    def test_weight_above_capacity(self):
+        self.assertTrue(self.pool.acquire('backup', 10))
+        self.assertEqual(self.pool.get_usage(), 4)
+
+    def test_dead_holder(self):
+        self.assertTrue(self.pool.acquire('backup', 4))
+        with open(POOL_FILE) as fd:
+            data = json.load(fd)
+        for holder in data['holders'].values():
+            holder['pid'] = 999999999
+        with open(POOL_FILE, 'w') as fd:
+            json.dump(data, fd)
+        self.assertTrue(self.pool.acquire('sync', 4))
+
+    def test_aging(self):
+        now = 1700000000
+        with patch.object(module.time, 'time', return_value=now):
+            self.assertTrue(self.pool.acquire('index', 2))
+            self.assertFalse(self.pool.acquire('backup', 3))
+            self.assertTrue(self.pool.acquire('sync', 1))
+            self.pool.release('sync')
+        with patch.object(module.time, 'time', return_value=now + 500):
+            self.assertFalse(self.pool.acquire('backup', 3))
+            self.assertTrue(self.pool.acquire('sync', 1))
+            self.pool.release('sync')
+        with patch.object(module.time, 'time', return_value=now + 700):
+            # backup is starving, newer requests must wait even if they fit
+            self.assertFalse(self.pool.acquire('sync', 1))
+            self.pool.release('index')
+            self.assertTrue(self.pool.acquire('backup', 3))
+            self.assertTrue(self.pool.acquire('sync', 1))
+
+
+class ServiceResourcesTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+        self.pool = module.ResourcePool(capacity=4, file=POOL_FILE)
+        self.runs = 0
+
+    def _target(self):
+        self.runs += 1
+        self.usage = self.pool.get_usage()
+
+    def test_1(self):
+        se = service.Service(target=self._target, work_dir=WORK_DIR, run_delta=3600, resource_weight=3,
+                             resource_pool=self.pool)
+        self.assertTrue(self.pool.acquire('other', 2))
+        se.run_once()
+        self.assertEqual(self.runs, 0)
+        self.assertEqual(se.tracker_data['attempts'][-1]['code'], 'resource_busy')
+        self.assertEqual(se._get_sleep_delta(), se.resource_retry_delta)
+
+        self.pool.release('other')
+        se.run_once()
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(self.usage, 3)
+        self.assertEqual(self.pool.get_usage(), 0)
+        self.assertEqual(se._get_sleep_delta(), se.attempt_delta)
+
+    def test_unusable_pool(self):
+        se = service.Service(target=self._target, work_dir=WORK_DIR, run_delta=3600, resource_weight=3,
+                             resource_pool=self.pool)
+        with patch.object(self.pool, 'acquire', side_effect=PermissionError(13, 'denied')):
+            se.run_once()
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(se.tracker_data['attempts'][-1]['code'], 'ready')
+
+    def test_release_on_failure(self):
+        se = service.Service(target=self._target, work_dir=WORK_DIR, run_delta=3600, resource_weight=3,
+                             resource_pool=self.pool)
+        # the tracker is saved once the resources are acquired, before the run
+        with patch.object(se, '_save_tracker_data', side_effect=OSError(28, 'no space left')):
+            se.run_once()
+        self.assertEqual(self.runs, 0)
+        self.assertFalse(se.resources_acquired)
+        self.assertEqual(self.pool.get_usage(), 0)
+
+
+class PoolDirTestCase(unittest.TestCase):
+    def test_per_user(self):
+        path = module.get_pool_dir()
+        self.assertTrue(os.path.isdir(path))
+        self.assertTrue(os.access(path, os.W_OK))
+        if hasattr(os, 'getuid'):
+            self.assertEqual(os.stat(path).st_uid, os.getuid())
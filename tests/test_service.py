@@ -4,12 +4,17 @@ from multiprocessing import Process
 import os
 from pprint import pprint
 import shutil
+import subprocess
+import sys
 import time
 import unittest
 from unittest.mock import patch
 
+import psutil
+
 from tests import WORK_DIR
 from svcutils import service as module
+from svcutils.tracker import Attempt
 
 logger = logging.getLogger(__name__)
 
@@ -134,6 +139,7 @@ class SingleInstanceTestCase(unittest.TestCase):
         p1 = Process(target=self._target)
         p1.start()
         pids.append(p1.pid)
+        time.sleep(.5)
         p2 = Process(target=self._target)
         p2.start()
         time.sleep(3)
@@ -146,6 +152,48 @@ class SingleInstanceTestCase(unittest.TestCase):
             ran_pids = [int(r) for r in fd.read().splitlines()]
         self.assertEqual(ran_pids, pids)
 
+    def _run_target(self, slots=1, timeout=None):
+        @module.single_instance(WORK_DIR, slots=slots, timeout=timeout)
+        def target():
+            with open(self.pid_file, 'a') as fd:
+                fd.write(f'{os.getpid()}\n')
+            time.sleep(2)
+
+        target()
+
+    def _get_ran_pids(self):
+        with open(self.pid_file) as fd:
+            return [int(r) for r in fd.read().splitlines()]
+
+    def test_stale_lockfile(self):
+        with open(self.lock_file, 'w') as fd:
+            fd.write('999999999')
+        p = Process(target=self._run_target)
+        p.start()
+        p.join()
+        self.assertEqual(self._get_ran_pids(), [p.pid])
+        self.assertFalse(os.path.exists(self.lock_file))
+
+    def test_slots(self):
+        procs = [Process(target=self._run_target, kwargs={'slots': 2}) for i in range(3)]
+        for p in procs:
+            p.start()
+            time.sleep(.3)
+        for p in procs:
+            p.join()
+        self.assertEqual(self._get_ran_pids(), [p.pid for p in procs[:2]])
+        self.assertEqual(procs[2].exitcode, 1)
+
+    def test_timeout(self):
+        procs = [Process(target=self._run_target, kwargs={'timeout': 5}) for i in range(2)]
+        for p in procs:
+            p.start()
+            time.sleep(.3)
+        for p in procs:
+            p.join()
+        self.assertEqual(self._get_ran_pids(), [p.pid for p in procs])
+        self.assertEqual([p.exitcode for p in procs], [0, 0])
+
 
 class ServiceTestCase(unittest.TestCase):
     def setUp(self):
@@ -161,11 +209,9 @@ class ServiceTestCase(unittest.TestCase):
         print('*' * 80)
         print(f'running at {now=}')
         service = module.Service(target=self._target, work_dir=WORK_DIR, run_delta=60 * 30, **(service_args or {}))
-        with patch('svcutils.service.datetime') as mock_datetime, \
-                patch('svcutils.service.time.time', return_value=now.timestamp()), \
+        with patch('svcutils.service.time.time', return_value=now.timestamp()), \
                 patch('svcutils.service.is_fullscreen', return_value=is_fullscreen), \
                 patch('svcutils.service.get_volume_labels', return_value=volume_labels):
-            mock_datetime.now.return_value = now
             service.run_once()
         data = service._load_tracker_data()
         pprint(data)
@@ -314,3 +360,248 @@ class ServiceTestCase(unittest.TestCase):
         dt4 = end_dt + timedelta(minutes=2)
         data = self._run_once(dt4, service_args, volume_labels=['vol1', 'vol3'])
         self._check_data(data, last_run_dt=dt4, last_attempt_dt=dt4)
+
+
+class RetryTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+        self.runs = 0
+        self.fail = True
+        self.now = datetime.now().replace(minute=0, second=0)
+
+    def _target(self):
+        self.runs += 1
+        if self.fail:
+            raise Exception('failed')
+
+    def _run_once(self, now, retry_policy):
+        service = module.Service(target=self._target, work_dir=WORK_DIR, run_delta=3600, retry_policy=retry_policy)
+        with patch('svcutils.service.time.time', return_value=now.timestamp()), \
+                patch('svcutils.service.is_fullscreen', return_value=False):
+            service.run_once()
+            sleep_delta = service._get_sleep_delta()
+        data = service._load_tracker_data()
+        pprint(data)
+        return data, sleep_delta
+
+    def test_backoff(self):
+        retry_policy = module.RetryPolicy(max_retries=2, base_delta=60, factor=2, jitter=0)
+        data, sleep_delta = self._run_once(self.now, retry_policy)
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(data['attempts'][-1]['code'], 'failed')
+        self.assertEqual(data['failures']['count'], 1)
+        self.assertEqual(data['failures']['retry_ts'], self.now.timestamp() + 60)
+        self.assertEqual(sleep_delta, 60)
+
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=30), retry_policy)
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(data['attempts'][-1]['code'], 'not_ready')
+        self.assertEqual(sleep_delta, 30)
+
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=60), retry_policy)
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(data['failures']['count'], 2)
+        self.assertEqual(data['failures']['retry_ts'], self.now.timestamp() + 60 + 120)
+
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=180), retry_policy)
+        self.assertEqual(self.runs, 3)
+        self.assertEqual(data['failures']['count'], 3)
+        self.assertEqual(data['failures']['retry_ts'], None)
+
+        # max retries reached, back to run_delta
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=600), retry_policy)
+        self.assertEqual(self.runs, 3)
+
+        self.fail = False
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=180 + 3600), retry_policy)
+        self.assertEqual(self.runs, 4)
+        self.assertEqual(data['failures'], None)
+        self.assertTrue(data['last_run']['end_ts'])
+
+    def test_circuit_breaker(self):
+        retry_policy = module.RetryPolicy(max_retries=5, base_delta=60, factor=1, jitter=0,
+                                          circuit_threshold=2, circuit_delta=7200)
+        data, sleep_delta = self._run_once(self.now, retry_policy)
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=60), retry_policy)
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(data['failures']['circuit_ts'], self.now.timestamp() + 60 + 7200)
+
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=3700), retry_policy)
+        self.assertEqual(self.runs, 2)
+        self.assertEqual(data['attempts'][-1]['code'], 'circuit_open')
+        self.assertEqual(sleep_delta, 120)
+
+        # half-open: a single trial run, reopens on failure
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=7260), retry_policy)
+        self.assertEqual(self.runs, 3)
+        self.assertEqual(data['failures']['circuit_ts'], self.now.timestamp() + 7260 + 7200)
+
+        self.fail = False
+        data, sleep_delta = self._run_once(self.now + timedelta(seconds=7260 * 2), retry_policy)
+        self.assertEqual(self.runs, 4)
+        self.assertEqual(data['failures'], None)
+
+
+class SpreadTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def _get_service(self, last_run_ts, **kwargs):
+        service = module.Service(target=lambda: None, work_dir=WORK_DIR, run_delta=3600, **kwargs)
+        service.tracker_data['last_run'] = Attempt(ts=last_run_ts)
+        return service
+
+    def test_default(self):
+        self.assertEqual(self._get_service(1000)._get_next_run_ts(), 4600)
+
+    def test_phase(self):
+        with patch.object(module, 'get_host_phase', return_value=600):
+            self.assertEqual(self._get_service(3600 * 10 + 600, spread_runs=True)._get_next_run_ts(),
+                             3600 * 11 + 600)
+            # delayed runs are pulled back on the host's slot
+            self.assertEqual(self._get_service(3600 * 10 + 1200, spread_runs=True)._get_next_run_ts(),
+                             3600 * 11 + 600)
+            self.assertEqual(self._get_service(3600 * 10 + 3000, spread_runs=True)._get_next_run_ts(),
+                             3600 * 12 + 600)
+
+    def test_jitter(self):
+        res = self._get_service(1000, max_jitter=300)._get_next_run_ts()
+        self.assertTrue(4600 <= res < 4900)
+        self.assertEqual(self._get_service(1000, max_jitter=300)._get_next_run_ts(), res)
+        values = {self._get_service(1000 + i, max_jitter=300)._get_next_run_ts() - i for i in range(20)}
+        self.assertTrue(len(values) > 10)
+
+
+class MemoryTestCase(unittest.TestCase):
+    def test_memory_info(self):
+        res = module.get_memory_info()
+        self.assertTrue(res['available'] > 0)
+        self.assertTrue(0 <= res['swap_percent'] <= 100)
+
+    def test_check_memory(self):
+        with patch.object(module, 'get_memory_info', return_value={'available': 1000, 'swap_percent': 50}):
+            self.assertTrue(module.check_memory())
+            self.assertTrue(module.check_memory(min_available=1000, max_swap_percent=50))
+            self.assertFalse(module.check_memory(min_available=1001))
+            self.assertFalse(module.check_memory(max_swap_percent=0))
+
+    def test_service(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+        service = module.Service(target=lambda: None, work_dir=WORK_DIR, min_available_memory=2000)
+        with patch.object(module, 'get_memory_info', return_value={'available': 1000, 'swap_percent': 50}), \
+                patch.object(module, 'is_fullscreen', return_value=False):
+            service.run_once()
+        self.assertEqual(service.tracker_data['attempts'][-1]['code'], 'low_memory')
+        self.assertEqual(service.tracker_data['last_run'], None)
+        service.run_once(force=True)
+        self.assertTrue(service.tracker_data['last_run']['peak_rss'] > 0)
+
+
+class IdleTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_get_idle_seconds(self):
+        res = module.get_idle_seconds()
+        self.assertTrue(res is None or res >= 0)
+
+    def test_user_active(self):
+        idle = [10]
+        service = module.Service(target=lambda: None, work_dir=WORK_DIR, min_idle_seconds=60,
+                                 idle_source=lambda: idle[0])
+        with patch.object(module, 'is_fullscreen', return_value=False):
+            service.run_once()
+            self.assertEqual(service.tracker_data['attempts'][-1]['code'], 'user_active')
+            self.assertEqual(service.tracker_data['last_run'], None)
+            self.assertTrue(49 < service._get_sleep_delta() <= 50)
+            idle[0] = 60
+            service.run_once()
+        self.assertEqual(service.tracker_data['attempts'][-1]['code'], 'ready')
+        self.assertTrue(service.tracker_data['last_run'])
+
+    def test_unknown_idle(self):
+        service = module.Service(target=lambda: None, work_dir=WORK_DIR, min_idle_seconds=60,
+                                 idle_source=lambda: None)
+        with patch.object(module, 'is_fullscreen', return_value=False):
+            service.run_once()
+        self.assertEqual(service.tracker_data['attempts'][-1]['code'], 'ready')
+
+    def test_throttle(self):
+        idle = [0]
+        proc = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        try:
+            ps_proc = psutil.Process(proc.pid)
+            throttle = module.ActivityThrottle(lambda: idle[0], min_idle_seconds=60, action='pause')
+            throttle(proc.pid)
+            time.sleep(.2)
+            self.assertEqual(ps_proc.status(), psutil.STATUS_STOPPED)
+            idle[0] = 120
+            throttle(proc.pid)
+            time.sleep(.2)
+            self.assertNotEqual(ps_proc.status(), psutil.STATUS_STOPPED)
+
+            nice = ps_proc.nice()
+            ionice = ps_proc.ionice()
+            idle[0] = 0
+            throttle = module.ActivityThrottle(lambda: idle[0], min_idle_seconds=60, action='renice')
+            throttle(proc.pid)
+            self.assertEqual(ps_proc.ionice().ioclass, psutil.IOPRIO_CLASS_IDLE)
+            self.assertEqual(ps_proc.nice(), 19 if module.can_lower_nice(nice) else nice)
+            idle[0] = 120
+            throttle(proc.pid)
+            self.assertFalse(throttle.is_throttled)
+            self.assertEqual(ps_proc.ionice(), ionice)
+            self.assertEqual(ps_proc.nice(), nice)
+
+            # without the privilege to restore it the cpu priority is left alone
+            with patch.object(module, 'can_lower_nice', return_value=False):
+                idle[0] = 0
+                throttle(proc.pid)
+                self.assertEqual(ps_proc.ionice().ioclass, psutil.IOPRIO_CLASS_IDLE)
+                self.assertEqual(ps_proc.nice(), nice)
+                idle[0] = 120
+                throttle(proc.pid)
+            self.assertEqual(ps_proc.ionice(), ionice)
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+class WakeTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_wake(self):
+        service = module.Service(target=lambda: None, work_dir=WORK_DIR)
+        start_ts = time.monotonic()
+        service.wake('network')
+        service._sleep(10)
+        self.assertTrue(time.monotonic() - start_ts < 1)
+        self.assertEqual(service._pop_wake_reasons(), {'network'})
+        self.assertEqual(service._pop_wake_reasons(), set())
+
+    def test_network_trigger_uptime(self):
+        service = module.Service(target=lambda: None, work_dir=WORK_DIR, min_uptime=180, requires_online=True,
+                                 trigger_on_network_change=True)
+        now = time.time()
+        service.tracker_data['attempts'] = [Attempt(ts=now - i * 120, is_online=i == 0) for i in range(4)]
+        self.assertFalse(service._check_uptime())
+        service.wake_reasons = {'network'}
+        self.assertTrue(service._check_uptime())
+
+    def test_network_retry(self):
+        service = module.Service(target=lambda: None, work_dir=WORK_DIR)
+        now = time.time()
+        service.wake_reasons = {'network'}
+        service.tracker_data['failures'] = {'count': 1, 'retry_ts': now + 60, 'circuit_ts': None}
+        self.assertTrue(service._is_retry_due())
+        # no retry pending: retries exhausted or no retry policy
+        service.tracker_data['failures'] = {'count': 5, 'retry_ts': None, 'circuit_ts': None}
+        self.assertFalse(service._is_retry_due())
+        service.tracker_data['failures'] = {'count': 5, 'retry_ts': None, 'circuit_ts': now + 60}
+        self.assertFalse(service._is_retry_due())
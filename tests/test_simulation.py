@@ -0,0 +1,51 @@
+import unittest
+
+from svcutils import simulation as module
+
+HOUR = 3600
+
+
+class TimelineTestCase(unittest.TestCase):
+    def test_1(self):
+        timeline = module.Timeline([(10, 'b'), (0, 'a')], default='x')
+        self.assertEqual([timeline.get(t) for t in (-1, 0, 9, 10, 100)], ['x', 'a', 'a', 'b', 'b'])
+        timeline = module.Timeline([(0, False), (HOUR, True)], period=2 * HOUR)
+        self.assertEqual([timeline.get(t) for t in (0, HOUR, 2 * HOUR, 3 * HOUR)], [False, True, False, True])
+
+    def test_invalid_probe(self):
+        self.assertRaises(ValueError, module.get_timelines, {'invalid': True})
+
+
+class SimulateTestCase(unittest.TestCase):
+    def test_regular(self):
+        res = module.simulate(duration=module.DAY, run_delta=HOUR, attempt_delta=120)
+        self.assertEqual(res['runs'], 24)
+        self.assertEqual(res['codes']['ready'], 24)
+        self.assertEqual(res['max_latency'], 0)
+        self.assertEqual(res['tracker_saves'], res['attempts'] + res['runs'])
+        self.assertTrue(res['tracker_bytes'] > 0)
+
+    def test_probes(self):
+        # offline half of the day, fullscreen during the first online hour
+        probes = {
+            'online': {'steps': [(0, False), (12 * HOUR, True)], 'period': module.DAY},
+            'fullscreen': {'steps': [(0, False), (12 * HOUR, True), (13 * HOUR, False)], 'period': module.DAY},
+        }
+        res = module.simulate(duration=2 * module.DAY, probes=probes, run_delta=HOUR, attempt_delta=120,
+                              min_uptime=600, requires_online=True, measure_io=False)
+        self.assertTrue(res['codes']['uptime_too_low'] > 0)
+        self.assertTrue(res['codes']['fullscreen'] > 0)
+        self.assertTrue(0 < res['runs'] < 24)
+        self.assertTrue(res['max_latency'] > 12 * HOUR)
+        self.assertEqual(res['tracker_bytes'], None)
+
+    def test_failures(self):
+        res = module.simulate(duration=module.DAY, probes={'fails': True}, run_delta=HOUR,
+                              retry_policy=module.service.RetryPolicy(max_retries=2, base_delta=60, jitter=0))
+        # two retries after the first failure, then regular runs
+        self.assertEqual(res['codes']['failed'], 24 + 2)
+
+    def test_volume_trigger(self):
+        probes = {'volumes': [(0, ['a']), (HOUR / 2, ['a', 'b'])]}
+        res = module.simulate(duration=HOUR, probes=probes, run_delta=module.DAY, trigger_on_volume_change=True)
+        self.assertEqual(res['runs'], 2)
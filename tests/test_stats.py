@@ -0,0 +1,122 @@
+import io
+import json
+import os
+import shutil
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import service
+from svcutils import stats as module
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def generate_tracker_data(runs=10, run_delta=600, attempt_delta=120, duration=30):
+    attempts = []
+    ts = 1700000000.
+    for i in range(runs):
+        attempts.append({'ts': ts, 'dt': 'dt', 'is_online': None, 'volume_labels': None,
+                         'code': 'ready', 'end_ts': ts + duration + i})
+        for j in range(run_delta // attempt_delta - 1):
+            attempts.append({'ts': ts + attempt_delta * (j + 1), 'dt': 'dt', 'is_online': None,
+                             'volume_labels': None, 'code': 'fullscreen' if j == 0 else 'not_ready'})
+        ts += run_delta
+    return {
+        'attempts': attempts,
+        'last_run': attempts[-1],
+        'settings': {'run_delta': run_delta, 'attempt_delta': attempt_delta},
+    }
+
+
+class TrackerReaderTestCase(unittest.TestCase):
+    def test_1(self):
+        data = generate_tracker_data(runs=50)
+        content = json.dumps(data, indent=4, sort_keys=True)
+        for chunk_size in (1, 7, 64, 65536):
+            attempts = []
+            others = {}
+            for key, value in module.TrackerReader(io.StringIO(content), chunk_size=chunk_size):
+                if key == 'attempts':
+                    attempts.append(value)
+                else:
+                    others[key] = value
+            self.assertEqual(attempts, data['attempts'])
+            self.assertEqual(others, {k: v for k, v in data.items() if k != 'attempts'})
+
+    def test_empty(self):
+        self.assertEqual(list(module.TrackerReader(io.StringIO('{"attempts": [], "last_run": null}'))),
+                         [('last_run', None)])
+        self.assertRaises(ValueError, list, module.TrackerReader(io.StringIO('{"attempts": [{')))
+
+
+class StatsTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        self.work_dir = os.path.join(WORK_DIR, '.svc1')
+        os.makedirs(self.work_dir)
+        with open(os.path.join(self.work_dir, module.TRACKER_FILENAME), 'w') as fd:
+            json.dump(generate_tracker_data(runs=10), fd, indent=4, sort_keys=True)
+
+    def test_report(self):
+        with patch.object(module, 'HOME_DIR', WORK_DIR):
+            reports = module.get_reports()
+        self.assertEqual(len(reports), 1)
+        report = reports[0]
+        self.assertEqual(report['name'], 'svc1')
+        self.assertEqual(report['attempts'], 50)
+        self.assertEqual(report['runs'], 10)
+        self.assertEqual(report['codes'], {'not_ready': 30, 'ready': 10, 'fullscreen': 10})
+        self.assertEqual(report['duration_percentiles'], {'p50': 34, 'p90': 38, 'p99': 39})
+        self.assertEqual(report['max_duration'], 39)
+        self.assertEqual(report['median_run_interval'], 600)
+        self.assertEqual(report['run_interval_ratio'], 1)
+        self.assertEqual(report['wasted_wakeups'], 30)
+        self.assertEqual(report['wasted_wakeup_ratio'], .6)
+
+    def test_main(self):
+        with patch('builtins.print') as mock_print:
+            module.main([self.work_dir, '--json'])
+        reports = json.loads(mock_print.call_args_list[0].args[0])
+        self.assertEqual(reports[0]['runs'], 10)
+        with patch('builtins.print') as mock_print:
+            module.main([self.work_dir])
+        lines = mock_print.call_args_list[0].args[0].splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('svc1 '))
+
+
+class ServiceHistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        self.work_dir = os.path.join(WORK_DIR, '.svc2')
+        os.makedirs(self.work_dir)
+
+    def test_report(self):
+        # the tracker file produced by a service only keeps the recent attempts
+        now = [1700000000.]
+
+        def target():
+            now[0] += 30
+
+        se = service.Service(target=target, work_dir=self.work_dir, run_delta=600, attempt_delta=120,
+                             clock=lambda: now[0])
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            for i in range(200):
+                se.run_once()
+                now[0] += 120
+        self.assertTrue(len(se.tracker_data['attempts']) < 10)
+        report = module.get_reports([self.work_dir])[0]
+        self.assertEqual(report['source'], 'history')
+        self.assertEqual(report['attempts'], 200)
+        self.assertEqual(report['runs'], 40)
+        self.assertEqual(report['completed_runs'], 40)
+        self.assertEqual(report['duration_percentiles'], {'p50': 30, 'p90': 30, 'p99': 30})
+        # the target duration delays the next runs
+        self.assertEqual(report['median_run_interval'], 630)
+        self.assertEqual(report['wasted_wakeups'], 160)
@@ -0,0 +1,108 @@
+import io
+import json
+import os
+import shutil
+import unittest
+
+from tests import WORK_DIR
+from svcutils import tracker as module
+
+
+def generate_data():
+    # legacy format: dicts with dates and full volume labels
+    attempts = [
+        {'ts': 1700000000., 'dt': '2023-11-14T23:13:20', 'is_online': True, 'volume_labels': ['b', 'a'],
+         'code': 'ready', 'end_ts': 1700000030., 'end_dt': '2023-11-14T23:13:50', 'peak_rss': 1000},
+        {'ts': 1700000120., 'dt': '2023-11-14T23:15:20', 'is_online': False, 'volume_labels': ['a', 'b'],
+         'code': 'failed', 'error': 'error'},
+        {'ts': 1700000240., 'dt': '2023-11-14T23:17:20', 'is_online': None, 'volume_labels': None,
+         'code': None},
+    ]
+    return {'attempts': attempts, 'last_run': dict(attempts[0]), 'failures': None}
+
+
+class AttemptTestCase(unittest.TestCase):
+    def test_dict_like(self):
+        attempt = module.Attempt(ts=1700000000., volume_labels=['a'])
+        self.assertEqual(attempt['ts'], 1700000000.)
+        self.assertTrue(attempt['dt'])
+        self.assertFalse('end_ts' in attempt)
+        self.assertFalse('end_dt' in attempt)
+        self.assertEqual(attempt.get('end_ts', 0), 0)
+        attempt.update(code='ready', end_ts=1700000010., peak_rss=10, end_dt='ignored')
+        self.assertTrue('end_ts' in attempt)
+        self.assertNotEqual(attempt['end_dt'], 'ignored')
+        self.assertEqual((attempt.code, attempt['peak_rss'], attempt.get('error')), ('ready', 10, None))
+        self.assertRaises(KeyError, lambda: attempt['error'])
+
+    def test_interned_labels(self):
+        attempt1 = module.Attempt(ts=1, volume_labels=['a', 'b'])
+        attempt2 = module.Attempt(ts=2, volume_labels=['b', 'a'])
+        self.assertTrue(attempt1.volume_labels is attempt2.volume_labels)
+        self.assertEqual(module.Attempt(ts=3).volume_labels, None)
+
+
+class TrackerDataTestCase(unittest.TestCase):
+    def test_load(self):
+        raw = generate_data()
+        data = module.load_tracker_data(raw)
+        self.assertTrue(data['last_run'] is data['attempts'][0])
+        self.assertEqual(data['attempts'][1]['error'], 'error')
+        self.assertEqual(data['attempts'][0]['volume_labels'], frozenset(['a', 'b']))
+
+    def test_partial_records(self):
+        # records missing some of the usual fields keep their extra fields
+        for raw in [
+            {'ts': 1700000000., 'code': 'failed', 'error': 'error', 'peak_rss': 1000},
+            {'ts': 1700000000., 'code': None, 'end_ts': 1700000030., 'peak_rss': 1000},
+        ]:
+            attempt = module.Attempt.from_dict(raw)
+            for key, value in raw.items():
+                self.assertEqual(attempt[key], value)
+
+    def test_round_trip(self):
+        raw = generate_data()
+        buf = io.StringIO()
+        module.write_tracker_data(module.load_tracker_data(raw), buf)
+        res = json.loads(buf.getvalue())
+        self.assertEqual(len(res['attempts']), 3)
+        for attempt, expected in zip(res['attempts'], raw['attempts']):
+            self.assertEqual(set(attempt), set(expected))
+            self.assertEqual(attempt['ts'], expected['ts'])
+            self.assertEqual(sorted(attempt['volume_labels'] or []), sorted(expected['volume_labels'] or []))
+        self.assertEqual(res['last_run'], res['attempts'][0])
+        self.assertEqual(res['failures'], None)
+        self.assertEqual(module.load_tracker_data(res), module.load_tracker_data(raw))
+
+    def test_empty(self):
+        buf = io.StringIO()
+        module.write_tracker_data({'attempts': [], 'last_run': None}, buf)
+        self.assertEqual(json.loads(buf.getvalue()), {'attempts': [], 'last_run': None})
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        if os.path.isdir(WORK_DIR):
+            shutil.rmtree(WORK_DIR)
+        os.makedirs(WORK_DIR)
+        self.file = os.path.join(WORK_DIR, module.HISTORY_FILENAME)
+
+    def test_rotation(self):
+        history = module.History(self.file, max_size=1000, backup_count=2)
+        for i in range(100):
+            history.append(module.Attempt(ts=i, code='ready', end_ts=i + .5, peak_rss=10))
+        self.assertEqual(len(history.get_files()), 3)
+        res = list(history)
+        # the oldest attempts were rotated out, the others are in order
+        self.assertTrue(0 < len(res) < 100)
+        self.assertEqual([a['ts'] for a in res], list(range(100 - len(res), 100)))
+        self.assertEqual(res[-1], {'ts': 99, 'is_online': None, 'volume_labels': None, 'code': 'ready',
+                                   'end_ts': 99.5, 'peak_rss': 10})
+
+    def test_truncated_line(self):
+        history = module.History(self.file)
+        history.append(module.Attempt(ts=1, code='ready'))
+        with open(self.file, 'a') as fd:
+            fd.write('{"ts": 2, "co')
+        history.append(module.Attempt(ts=3, code='ready'))
+        self.assertEqual([a['ts'] for a in history], [1, 3])
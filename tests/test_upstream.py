@@ -0,0 +1,138 @@
+import os
+import shutil
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+from tests import WORK_DIR
+from svcutils import upstream as module
+from svcutils import service
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def wait_for(func, timeout=10):
+    end_ts = time.monotonic() + timeout
+    while time.monotonic() < end_ts:
+        if func():
+            return True
+        time.sleep(.05)
+    return False
+
+
+class UpstreamTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+        self.run_file = os.path.join(WORK_DIR, 'upstream.run')
+        self.upstream_dir = os.path.join(WORK_DIR, 'upstream')
+        os.makedirs(self.upstream_dir)
+
+    def test_run_file(self):
+        upstream = module.Upstream(self.run_file)
+        self.assertEqual(upstream.get_ts(), 0)
+        service.RunFile(self.run_file).touch()
+        self.assertEqual(upstream.get_ts(), service.RunFile(self.run_file).get_ts())
+
+    def test_tracker(self):
+        svc = service.Service(target=lambda: None, work_dir=self.upstream_dir)
+        upstream = module.Upstream(svc.tracker_file, is_tracker=True)
+        self.assertEqual(upstream.get_ts(), 0)
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            svc.run_once()
+        self.assertEqual(upstream.get_ts(), svc.tracker_data['last_run'].end_ts)
+
+    def test_get_upstream(self):
+        svc = service.Service(target=lambda: None, work_dir=self.upstream_dir)
+        tracker_file = os.path.join(self.upstream_dir, service.TRACKER_FILENAME)
+        for value, file, is_tracker in [
+            (svc, tracker_file, True),
+            (self.upstream_dir, tracker_file, True),
+            (tracker_file, tracker_file, True),
+            (service.RunFile(self.run_file), self.run_file, False),
+            (self.run_file, self.run_file, False),
+        ]:
+            res = service.get_upstream(value)
+            self.assertEqual((res.file, res.is_tracker), (file, is_tracker))
+
+    def _get_watcher_calls(self, **kwargs):
+        calls = []
+        watcher = module.UpstreamWatcher([module.Upstream(self.run_file)], callback=lambda: calls.append(1),
+                                         **kwargs).start()
+        try:
+            time.sleep(.2)
+            for i in range(3):
+                os.utime(self.run_file, (1000 + i, 1000 + i)) if os.path.exists(self.run_file) \
+                    else service.RunFile(self.run_file).touch()
+                time.sleep(.05)
+            self.assertTrue(wait_for(lambda: calls, timeout=5))
+            time.sleep(.5)
+        finally:
+            watcher.stop()
+        return calls
+
+    @unittest.skipIf(sys.platform != 'linux', 'inotify is linux only')
+    def test_watcher_inotify(self):
+        # repeated triggers are coalesced
+        self.assertEqual(len(self._get_watcher_calls(debounce=.3, poll_delta=60)), 1)
+
+    def test_watcher_polling(self):
+        self.assertEqual(len(self._get_watcher_calls(debounce=.3, poll_delta=.5, use_inotify=False)), 1)
+
+
+class ServiceUpstreamTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        self.work_dir = os.path.join(WORK_DIR, 'downstream')
+        self.upstream_dir = os.path.join(WORK_DIR, 'upstream')
+        os.makedirs(self.work_dir)
+        os.makedirs(self.upstream_dir)
+        self.run_file = service.RunFile(os.path.join(WORK_DIR, 'upstream.run'))
+
+    def test_run_file_trigger(self):
+        svc = service.Service(target=lambda: None, work_dir=self.work_dir, run_delta=3600,
+                              upstreams=[self.run_file])
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            svc.run_once()
+            self.assertEqual(svc.tracker_data['attempts'][-1].code, 'ready')
+            svc.run_once()
+            self.assertEqual(svc.tracker_data['attempts'][-1].code, 'not_ready')
+            time.sleep(.05)
+            self.run_file.touch()
+            svc.run_once()
+            self.assertEqual(svc.tracker_data['attempts'][-1].code, 'ready')
+            # the completion is consumed
+            svc.run_once()
+        self.assertEqual(svc.tracker_data['attempts'][-1].code, 'not_ready')
+        self.assertEqual(svc.tracker_data['upstream_ts'], self.run_file.get_ts())
+
+    def test_tracker_trigger(self):
+        upstream = service.Service(target=lambda: None, work_dir=self.upstream_dir, run_delta=3600)
+        svc = service.Service(target=lambda: None, work_dir=self.work_dir, run_delta=3600, upstreams=[upstream])
+        with patch.object(service, 'is_fullscreen', return_value=False):
+            svc.run_once()
+            upstream.run_once()
+            svc.run_once()
+            self.assertEqual(svc.tracker_data['attempts'][-1].code, 'ready')
+            # upstream attempts which do not complete a run do not trigger
+            upstream.run_once()
+            self.assertEqual(upstream.tracker_data['attempts'][-1].code, 'not_ready')
+            svc.run_once()
+        self.assertEqual(svc.tracker_data['attempts'][-1].code, 'not_ready')
+
+    def test_wake(self):
+        svc = service.Service(target=lambda: None, work_dir=self.work_dir, upstreams=[self.run_file],
+                              upstream_debounce=.1)
+        svc._start_watchers()
+        try:
+            time.sleep(.2)
+            self.run_file.touch()
+            self.assertTrue(wait_for(lambda: 'upstream' in svc._pending_wake_reasons, timeout=15))
+        finally:
+            svc._stop_watchers()
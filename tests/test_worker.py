@@ -0,0 +1,183 @@
+import os
+import shutil
+import time
+import unittest
+
+import psutil
+
+from tests import WORK_DIR
+from svcutils import worker as module
+from svcutils import service
+
+
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isfile(path):
+        os.remove(path)
+
+
+def succeed(file=None):
+    if file:
+        with open(file, 'w') as fd:
+            fd.write(f'{os.getpid()} {os.nice(0)}')
+
+
+def fail():
+    raise Exception('failed')
+
+
+def hang():
+    time.sleep(60)
+
+
+def allocate():
+    return bytearray(512 * 1024 * 1024)
+
+
+def allocate_and_release(size):
+    data = bytearray(size)
+    data[::4096] = b'x' * len(data[::4096])
+    time.sleep(.5)
+
+
+def succeed_with_checkpoint(file, checkpoint):
+    checkpoint.save('done', True)
+    succeed(file)
+
+
+def is_worker_process(proc):
+    # spawn and forkserver leave multiprocessing helper processes running
+    try:
+        cmdline = ' '.join(proc.cmdline())
+        return proc.is_running() and proc.status() != psutil.STATUS_ZOMBIE \
+            and 'resource_tracker' not in cmdline and 'forkserver' not in cmdline
+    except psutil.NoSuchProcess:
+        return False
+
+
+def wait(delta):
+    time.sleep(delta)
+
+
+def burn_cpu():
+    while True:
+        pass
+
+
+class WorkerTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_success(self):
+        file = os.path.join(WORK_DIR, 'out.txt')
+        res = module.Worker(nice=5).run(succeed, args=(file,))
+        self.assertEqual(res['code'], None)
+        self.assertEqual(res['exit_code'], 0)
+        self.assertTrue(res['peak_rss'] > 0)
+        with open(file) as fd:
+            pid, nice = [int(r) for r in fd.read().split()]
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual(nice, os.nice(0) + 5)
+
+    def test_failure(self):
+        res = module.Worker().run(fail)
+        self.assertEqual((res['code'], res['exit_code']), ('failed', module.EXIT_CODE_FAILED))
+
+    def test_timeout(self):
+        start_ts = time.monotonic()
+        res = module.Worker(timeout=1).run(hang)
+        self.assertEqual(res['code'], 'timeout')
+        self.assertTrue(time.monotonic() - start_ts < 10)
+
+    def test_out_of_memory(self):
+        res = module.Worker(max_memory=256 * 1024 * 1024).run(allocate)
+        self.assertEqual((res['code'], res['exit_code']), ('out_of_memory', module.EXIT_CODE_OUT_OF_MEMORY))
+
+    def test_cpu_time_exceeded(self):
+        res = module.Worker(max_cpu_time=1, timeout=30).run(burn_cpu)
+        self.assertEqual(res['code'], 'cpu_time_exceeded')
+
+    def test_peak_rss(self):
+        size = 200 * 1024 * 1024
+        res = module.Worker().run(allocate_and_release, args=(size,))
+        self.assertTrue(res['peak_rss'] > size)
+
+    def test_sampler(self):
+        with module.PeakRssSampler(interval=.05) as sampler:
+            allocate_and_release(100 * 1024 * 1024)
+        self.assertTrue(sampler.peak_rss > 100 * 1024 * 1024)
+
+    def test_on_wait(self):
+        pids = []
+        res = module.Worker().run(wait, args=(1.5,), on_wait=pids.append)
+        self.assertEqual(res['code'], None)
+        self.assertTrue(pids)
+
+    def test_paused_timeout(self):
+        throttle = service.ActivityThrottle(lambda: 0, min_idle_seconds=60, action='pause')
+        start_ts = time.monotonic()
+        res = module.Worker(timeout=2).run(hang, on_wait=throttle)
+        self.assertTrue(throttle.is_throttled)
+        self.assertEqual(res['code'], 'timeout')
+        self.assertTrue(time.monotonic() - start_ts < 10)
+
+    def test_start_methods(self):
+        import multiprocessing
+        file = os.path.join(WORK_DIR, 'out.txt')
+        for start_method in {'spawn', 'forkserver'} & set(multiprocessing.get_all_start_methods()):
+            res = module.Worker(start_method=start_method).run(succeed, args=(file,))
+            self.assertEqual(res['code'], None)
+            self.assertTrue(os.path.exists(file))
+            os.remove(file)
+            # unpicklable targets fail cleanly
+            res = module.Worker(start_method=start_method).run(lambda: None)
+            self.assertEqual(res['code'], 'failed')
+            self.assertTrue(res['error'])
+
+    def test_get_worker(self):
+        self.assertEqual(module.get_worker(None), None)
+        self.assertTrue(isinstance(module.get_worker(True), module.Worker))
+        self.assertEqual(module.get_worker({'timeout': 10}).timeout, 10)
+
+
+class ServiceWorkerTestCase(unittest.TestCase):
+    def setUp(self):
+        remove_path(WORK_DIR)
+        os.makedirs(WORK_DIR)
+
+    def test_success(self):
+        file = os.path.join(WORK_DIR, 'out.txt')
+        se = service.Service(target=succeed, args=(file,), work_dir=WORK_DIR, worker=True)
+        se.run_once()
+        self.assertTrue(os.path.exists(file))
+        data = se._load_tracker_data()
+        self.assertEqual(data['attempts'][-1]['code'], 'ready')
+        self.assertTrue(data['last_run']['end_ts'])
+        self.assertTrue(data['last_run']['peak_rss'] > 0)
+
+    def test_spawn(self):
+        file = os.path.join(WORK_DIR, 'out.txt')
+        se = service.Service(target=succeed_with_checkpoint, args=(file,), work_dir=WORK_DIR, checkpoint=True,
+                             worker={'start_method': 'spawn'})
+        se.run_once()
+        self.assertTrue(os.path.exists(file))
+        data = se._load_tracker_data()
+        self.assertEqual(data['attempts'][-1]['code'], 'ready')
+        self.assertTrue(data['last_run']['end_ts'])
+
+        se = service.Service(target=lambda: None, work_dir=WORK_DIR, worker={'start_method': 'spawn'})
+        se.run_once(force=True)
+        data = se._load_tracker_data()
+        self.assertEqual(data['attempts'][-1]['code'], 'failed')
+        self.assertEqual(data['failures']['count'], 1)
+
+    def test_timeout(self):
+        se = service.Service(target=hang, work_dir=WORK_DIR, worker={'timeout': 1})
+        se.run_once()
+        data = se._load_tracker_data()
+        self.assertEqual(data['attempts'][-1]['code'], 'timeout')
+        self.assertFalse('end_ts' in data['last_run'])
+        self.assertFalse(os.path.exists(os.path.join(WORK_DIR, service.LOCK_FILENAME)))
+        self.assertEqual([c for c in psutil.Process().children() if is_worker_process(c)], [])